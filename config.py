@@ -2,11 +2,63 @@
 zip_file_name="data/rawdata/raw.zip"
 csv_in_zip = "effectifs.csv"
 db_name="data/clean/cleaned_Data.db"
-table_name="effectifs"
+table_name="effectifs"   # vue qui reconstitue les lignes nettoyées à partir du schéma en étoile
+faits_table="faits_effectifs"   # table de faits : année, clés des dimensions et mesures
+dim_pathologie_table="dim_pathologie"
+dim_age_table="dim_age"
+dim_sexe_table="dim_sexe"
+dim_territoire_table="dim_territoire"
+partitions_table="partitions_annee"   # empreinte du contenu brut de chaque année
+cube_table="cube_territoires"   # agrégats précalculés pour la carte
+# résumés précalculés de la page histogrammes, par (niveau de pathologie, pathologie, sexe, année)
+resume_annees_table="resume_annees"
+resume_regions_table="resume_regions"
+resume_age_table="resume_age_sexe"
+resume_correlations_table="resume_correlations"
+catalogue_table="catalogue"   # valeurs des menus (arbre des pathologies, années, sexes, âges, territoires)
+manifest_table="manifest"   # manifeste de construction (ZIP source, nombre de lignes, version)
 output_csv_path="data/clean/effectifs_cleaned.csv"
+# instantané en colonnes de la page histogrammes (un .npy par colonne), projeté en mémoire par le dashboard
+INSTANTANE_DOSSIER="data/clean/instantane"
+
 dept_geojson="data/geojson/departement.geojson"
 region_geojson="data/geojson/region.geojson"
 
+# ingestion : "streaming" lit et nettoie le CSV par blocs (mémoire bornée),
+# "memoire" charge tout le fichier d'un coup (ancien comportement)
+INGEST_MODE = "streaming"
+CHUNK_SIZE = 200_000   # nombre de lignes par bloc en mode streaming
+CLEANING_WORKERS = None   # processus de nettoyage (None = nombre de cœurs, 1 = séquentiel)
+INCREMENTAL_REBUILD = True   # ne renettoyer que les années dont le contenu brut a changé
+SCHEMA_VERSION = 6   # à incrémenter quand le nettoyage ou le schéma change (force une reconstruction complète)
+
+# réglages SQLite : taille de page (appliquée à la construction), cache et mmap (par connexion de lecture)
+SQLITE_PAGE_SIZE = 16384
+SQLITE_CACHE_SIZE_KB = 64 * 1024
+SQLITE_MMAP_SIZE = 1024 * 1024 * 1024
+
+# pool de connexions en lecture du dashboard
+DB_POOL_MAX_CONNEXIONS = 16
+DB_POOL_TIMEOUT_S = 10          # attente maximale d'une connexion libre
+DB_POOL_HEALTH_CHECK_S = 30     # intervalle entre deux vérifications d'une connexion
+
+# serveur du dashboard : "developpement" (serveur Flask, un processus, rechargement automatique)
+# ou "production" (gunicorn, plusieurs processus qui partagent les données chargées avant le fork)
+SERVER_MODE = "developpement"
+SERVER_HOST = "127.0.0.1"   # "0.0.0.0" pour écouter sur toutes les interfaces
+SERVER_PORT = 8050
+SERVER_DEBUG = None   # débogueur Dash ; None = actif en développement, inactif en production
+SERVER_WORKERS = None   # processus gunicorn (None = nombre de cœurs)
+SERVER_THREADS = 4      # threads par processus
+SERVER_TIMEOUT_S = 120  # un worker bloqué plus longtemps est redémarré
+
+# cache des résultats de la carte (par processus), vidé à chaque reconstruction de la base
+CACHE_CARTE_MAX_ENTREES = 1024
+CACHE_CARTE_MAX_OCTETS = 64 * 1024 * 1024
+# cache disque des cartes déjà rendues (gzip), partagé par les processus du serveur
+CACHE_RENDU_DOSSIER = "data/cache_cartes"
+CACHE_RENDU_MAX_OCTETS = 512 * 1024 * 1024
+
 #nom des colonnes de la base de données
 COL_ANNEE = 'annee'
 COL_CODE_DEPT = 'dept'    #colonne code département
@@ -22,11 +74,27 @@ COL_PATHO_NV2 = 'patho_niv2'
 COL_PATHO_NV3 = 'patho_niv3'
 COL_TRI = 'tri'
 COL_TOP = 'top'
+COL_CLASSE_AGE = 'libelle_classe_age'
 
-ANNEE= [2015, 2016, 2017, 2018, 2019, 2020, 2021, 2022, 2023]
-SEXE = ['hommes', 'femmes', 'tous sexes']
-AGE=['0-4', '5-9', '10-14','15-19', '20-24', '25-29','30-34', '35-39', '40-44','45-49','50-54','55-59','60-64','65-69','70-74','75-79', '80-84','85-89','90-94', '95+', 'tsage']
+# Page histogrammes : nombre maximal de points dessinés dans le nuage Ntop / prévalence
+SCATTER_MAX_POINTS = 5000
+# "memoire" : table chargée au démarrage et indexée en mémoire (IndexHisto)
+# "requete" : rien n'est chargé, chaque graphique interroge la base pour sa sélection (RequetesHisto)
+HISTO_MODE = "memoire"
+# Filtres de la carte et de la page histogrammes :
+# "sqlite" : requêtes sur le cube et la table de faits
+# "bitmap" : moteur en mémoire construit au démarrage, une bitmap par valeur de dimension (MoteurBitmap)
+FILTRE_MOTEUR = "sqlite"
 
 #valeurs pour la cartographie
 COORDS = (48.7453229, 2.5073644) #centre de la france
 MAP_ZOOM_START = 6
+MAP_SIMPLIFY_TOLERANCES = [0.005, 0.01, 0.02]   # versions simplifiées précalculées (degrés)
+MAP_SIMPLIFY_TOLERANCE = 0.01   # version utilisée par le dashboard (0 = géométrie d'origine)
+# "donnees" : géométries envoyées une fois, puis seulement les valeurs de la sélection
+# "html" : document Folium complet reconstruit à chaque interaction (ancien mode)
+MAP_MODE = "donnees"
+# Pas de la grille de quantification du TopoJSON envoyé au navigateur (degrés) :
+# 0.002° ≈ 200 m, soit environ 1/10 de pixel au zoom MAP_ZOOM_START
+MAP_TOPOJSON_PAS = 0.002
+MAP_LOG_MESURES = False   # affiche la taille envoyée et le temps serveur de chaque mise à jour
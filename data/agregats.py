@@ -0,0 +1,270 @@
+import json
+import re
+import time
+import config
+
+# Dimensions du cube : les filtres de la carte, tels que choisis dans les menus (niveaux de
+# pathologie, sexe, classe d'âge, année). Plusieurs clés du schéma en étoile peuvent porter les
+# mêmes attributs (dim_pathologie distingue aussi top et niveau prioritaire) : le cube les
+# regroupe à la construction, une sélection complète y lit donc une seule ligne par territoire.
+DIMENSIONS_CUBE = [config.COL_PATHO_NV1, config.COL_PATHO_NV2, config.COL_PATHO_NV3,
+                   config.COL_SEXE, config.COL_TRANCHE_AGE, config.COL_ANNEE]
+
+# niveau de carte -> colonne du code territorial dans la dimension territoire
+NIVEAUX_TERRITOIRE = {"region": config.COL_CODE_REGION, "departement": config.COL_CODE_DEPT}
+
+
+def _table_existe(con, table):
+    return con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone() is not None
+
+
+def construire_cube(con, annees=None):
+    """
+    Matérialise le cube territorial utilisé par la carte : une ligne par combinaison
+    (niveau de carte, pathologie niv1 / niv2 / niv3, sexe, âge, année, territoire) avec les sommes de Ntop
+    et Npop, de quoi recalculer la prévalence moyenne (somme et nombre de prev) et la
+    prévalence pondérée par la population (100 * SUM(Ntop) / SUM(Npop)).
+    Avec `annees`, seules ces années sont recalculées (reconstruction incrémentale).
+    """
+    debut = time.perf_counter()
+    if annees is not None and not _table_existe(con, config.cube_table):
+        annees = None
+    if annees is not None and len(annees) == 0:
+        return
+    dims = ", ".join(f'"{c}"' for c in DIMENSIONS_CUBE)
+    if annees is None:
+        # reconstruction complète : la structure du cube a pu changer
+        con.execute(f'DROP TABLE IF EXISTS "{config.cube_table}"')
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{config.cube_table}" (
+            niveau TEXT NOT NULL,
+            {", ".join(f'"{c}" TEXT NOT NULL' for c in DIMENSIONS_CUBE[:-1])},
+            "{config.COL_ANNEE}" INTEGER NOT NULL,
+            code TEXT NOT NULL,
+            {config.COL_NTOP} INTEGER,
+            {config.COL_NPOP} INTEGER,
+            somme_prev REAL,
+            nb_prev INTEGER,
+            {config.COL_PREV} REAL,
+            prev_ponderee REAL,
+            PRIMARY KEY (niveau, {dims}, code)
+        ) WITHOUT ROWID""")
+
+    filtre_annees, params = "", []
+    if annees is not None:
+        filtre_annees = f' AND "{config.COL_ANNEE}" IN ({", ".join("?" * len(annees))})'
+        params = list(annees)
+        con.execute(f'DELETE FROM "{config.cube_table}" WHERE "{config.COL_ANNEE}" IN ({", ".join("?" * len(annees))})', params)
+    else:
+        con.execute(f'DELETE FROM "{config.cube_table}"')
+
+    # Agrégation sur la vue effectifs (faits et dimensions) ; les lignes dont un attribut de
+    # sélection est vide ne peuvent pas être choisies dans les menus et sont laissées de côté
+    non_nuls = " AND ".join(f'"{c}" IS NOT NULL' for c in DIMENSIONS_CUBE)
+    for niveau, col_code in NIVEAUX_TERRITOIRE.items():
+        con.execute(f"""
+            INSERT INTO "{config.cube_table}"
+            SELECT ?, {dims}, "{col_code}",
+                   SUM({config.COL_NTOP}), SUM({config.COL_NPOP}),
+                   SUM({config.COL_PREV}), COUNT({config.COL_PREV}), AVG({config.COL_PREV}),
+                   100.0 * SUM({config.COL_NTOP}) / SUM({config.COL_NPOP})
+            FROM "{config.table_name}"
+            WHERE {non_nuls} AND "{col_code}" IS NOT NULL{filtre_annees}
+            GROUP BY {dims}, "{col_code}"
+        """, [niveau] + params)
+    con.commit()
+
+    nb = con.execute(f'SELECT COUNT(*) FROM "{config.cube_table}"').fetchone()[0]
+    print(f"Cube territorial construit : {nb} lignes en {time.perf_counter() - debut:.1f} s")
+
+
+def requete_cube(col_code, where=None):
+    """
+    Requête de la carte sur le cube (lecture_BDD._lecture_cube_carte), une valeur par dimension
+    par défaut, ou la condition `where` sur DIMENSIONS_CUBE. Une sélection simple lit une ligne
+    par territoire, dans l'ordre de la clé primaire ; les listes de valeurs (IN) restent exactes
+    car la moyenne est recalculée à partir des sommes. Premier paramètre : le niveau de carte.
+    """
+    if where is None:
+        where = " AND ".join(f'"{c}" = ?' for c in DIMENSIONS_CUBE)
+    return f"""
+    SELECT code AS {col_code},
+           SUM({config.COL_NTOP}) AS {config.COL_NTOP},
+           SUM({config.COL_NPOP}) AS {config.COL_NPOP},
+           SUM(somme_prev) / SUM(nb_prev) AS {config.COL_PREV},
+           100.0 * SUM({config.COL_NTOP}) / SUM({config.COL_NPOP}) AS prev_ponderee
+    FROM "{config.cube_table}"
+    WHERE niveau = ? AND {where}
+    GROUP BY code
+    """
+
+
+# --- Résumés de la page histogrammes -------------------------------------------------------
+# Une sélection de la page = (niveau de pathologie, pathologie, sexe). Chaque résumé garde
+# l'année dans sa clé : les sommes s'additionnent d'une année à l'autre, ce qui permet la
+# reconstruction incrémentale par année comme pour le cube.
+
+NIVEAUX_PATHO = [config.COL_PATHO_NV1, config.COL_PATHO_NV2, config.COL_PATHO_NV3]
+
+# Variables de la matrice de corrélation
+VARIABLES_CORRELATION = [config.COL_NTOP, config.COL_NPOP, config.COL_PREV, config.COL_TRI]
+
+# table -> (dimension en plus de l'année ou None, colonnes et expressions des mesures)
+RESUMES = {
+    config.resume_annees_table: (None, [
+        ("somme_prev", f'TOTAL("{config.COL_PREV}")'),
+        ("nb_prev", f'COUNT("{config.COL_PREV}")'),
+        ("total_ntop", f'TOTAL("{config.COL_NTOP}")'),
+    ]),
+    config.resume_regions_table: (config.COL_CODE_REGION, [
+        ("somme_prev", f'TOTAL("{config.COL_PREV}")'),
+        ("nb_prev", f'COUNT("{config.COL_PREV}")'),
+    ]),
+    config.resume_age_table: (config.COL_CLASSE_AGE, [
+        ("somme_prev", f'TOTAL("{config.COL_PREV}")'),
+        ("nb_prev", f'COUNT("{config.COL_PREV}")'),
+    ]),
+}
+
+
+def paires_correlation():
+    """Paires (i <= j) de VARIABLES_CORRELATION."""
+    n = len(VARIABLES_CORRELATION)
+    return [(i, j) for i in range(n) for j in range(i, n)]
+
+
+def _mesures_correlation():
+    """
+    Sommes nécessaires au coefficient de Pearson de chaque paire, sur les lignes où les deux
+    variables sont renseignées (comme DataFrame.corr) : n, Σx, Σy, Σx², Σy², Σxy.
+    TOTAL et CAST en REAL : pas de dépassement d'entier sur les produits Npop × Npop.
+    """
+    mesures = []
+    for i, j in paires_correlation():
+        x, y = VARIABLES_CORRELATION[i], VARIABLES_CORRELATION[j]
+        presents = f'"{x}" IS NOT NULL AND "{y}" IS NOT NULL'
+        vx, vy = f'CAST("{x}" AS REAL)', f'CAST("{y}" AS REAL)'
+        for nom, expression in (("n", "1"), ("sx", vx), ("sy", vy),
+                                ("sxx", f"{vx} * {vx}"), ("syy", f"{vy} * {vy}"), ("sxy", f"{vx} * {vy}")):
+            mesures.append((f"{nom}_{i}_{j}", f"TOTAL(CASE WHEN {presents} THEN {expression} END)"))
+    return mesures
+
+
+RESUMES[config.resume_correlations_table] = (None, _mesures_correlation())
+
+
+def construire_resumes(con, annees=None):
+    """
+    Matérialise les résumés de la page histogrammes (série temporelle, moyenne par région,
+    grille âge × sexe, sommes de la matrice de corrélation) pour toutes les sélections.
+    Avec `annees`, seules ces années sont recalculées.
+    """
+    debut = time.perf_counter()
+    if annees is not None and not all(_table_existe(con, table) for table in RESUMES):
+        annees = None
+    if annees is not None and len(annees) == 0:
+        return
+
+    filtre_annees, params = "", []
+    if annees is not None:
+        filtre_annees = f' AND "{config.COL_ANNEE}" IN ({", ".join("?" * len(annees))})'
+        params = list(annees)
+
+    for table, (dimension, mesures) in RESUMES.items():
+        cles = ["niveau TEXT NOT NULL", "valeur TEXT NOT NULL", f'"{config.COL_SEXE}" NOT NULL', f'"{config.COL_ANNEE}" NOT NULL']
+        noms_cles = ["niveau", "valeur", f'"{config.COL_SEXE}"', f'"{config.COL_ANNEE}"']
+        if dimension is not None:
+            cles.append(f'"{dimension}" NOT NULL')
+            noms_cles.append(f'"{dimension}"')
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS "{table}" (
+                {", ".join(cles)},
+                {", ".join(f"{nom} REAL" for nom, _ in mesures)},
+                PRIMARY KEY ({", ".join(noms_cles)})
+            ) WITHOUT ROWID""")
+        if annees is not None:
+            con.execute(f'DELETE FROM "{table}" WHERE "{config.COL_ANNEE}" IN ({", ".join("?" * len(annees))})', params)
+        else:
+            con.execute(f'DELETE FROM "{table}"')
+
+        groupe = [f'"{config.COL_SEXE}"', f'"{config.COL_ANNEE}"'] + ([f'"{dimension}"'] if dimension else [])
+        non_nuls = " AND ".join(f"{c} IS NOT NULL" for c in groupe)
+        for niveau in NIVEAUX_PATHO:
+            con.execute(f"""
+                INSERT INTO "{table}"
+                SELECT ?, "{niveau}", {", ".join(groupe)}, {", ".join(expression for _, expression in mesures)}
+                FROM "{config.table_name}"
+                WHERE "{niveau}" IS NOT NULL AND {non_nuls}{filtre_annees}
+                GROUP BY "{niveau}", {", ".join(groupe)}
+            """, [niveau] + params)
+    con.commit()
+
+    tailles = {table: con.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in RESUMES}
+    print(f"Résumés de la page histogrammes construits en {time.perf_counter() - debut:.1f} s : "
+          + ", ".join(f"{table} {nb} lignes" for table, nb in tailles.items()))
+
+
+def _rang_age(classe):
+    """Tri des classes d'âge par borne inférieure ('0-4' < '5-9' < '95+'), les autres ('tsage') à la fin."""
+    debut = re.match(r"\d+", str(classe))
+    return (0, int(debut.group()), "") if debut else (1, 0, str(classe))
+
+
+def _annees(con):
+    """
+    Années présentes dans les faits, par sauts dans l'index idx_faits_annee (une recherche
+    MIN(annee) > précédente par année) au lieu d'un DISTINCT sur toute la table.
+    """
+    rows = con.execute(f"""
+        WITH RECURSIVE annees(a) AS (
+            SELECT MIN("{config.COL_ANNEE}") FROM "{config.faits_table}"
+            UNION ALL
+            SELECT (SELECT MIN("{config.COL_ANNEE}") FROM "{config.faits_table}" WHERE "{config.COL_ANNEE}" > a)
+            FROM annees WHERE a IS NOT NULL
+        )
+        SELECT a FROM annees WHERE a IS NOT NULL""").fetchall()
+    return [r[0] for r in rows]
+
+
+def construire_catalogue(con):
+    """
+    Matérialise le catalogue des menus du dashboard : une ligne JSON par entrée (arbre
+    niveau 1 -> niveau 2 -> niveaux 3 des pathologies, valeurs de chaque niveau, années,
+    sexes, classes d'âge, régions et départements), lu en une requête au démarrage.
+    À appeler après la purge des dimensions : seules les valeurs présentes dans les faits y figurent.
+    """
+    debut = time.perf_counter()
+    niveaux = ", ".join(f'"{n}"' for n in NIVEAUX_PATHO)
+    arbre = {}
+    # Un seul parcours des triplets triés ; l'ordre d'insertion des dict est celui des menus
+    for niv1, niv2, niv3 in con.execute(f'SELECT DISTINCT {niveaux} FROM "{config.dim_pathologie_table}" '
+                                        f'WHERE "{config.COL_PATHO_NV1}" IS NOT NULL ORDER BY {niveaux}'):
+        enfants = arbre.setdefault(niv1, {})
+        if niv2 is not None:
+            petits_enfants = enfants.setdefault(niv2, [])
+            if niv3 is not None and niv3 not in petits_enfants:
+                petits_enfants.append(niv3)
+
+    def distinctes(colonne, table):
+        rows = con.execute(f'SELECT DISTINCT "{colonne}" FROM "{table}" WHERE "{colonne}" IS NOT NULL ORDER BY 1')
+        return [r[0] for r in rows]
+
+    catalogue = {
+        "pathologies": arbre,
+        **{niveau: distinctes(niveau, config.dim_pathologie_table) for niveau in NIVEAUX_PATHO},
+        "annees": _annees(con),
+        # ordre du code sexe (hommes, femmes, tous sexes)
+        "sexes": [r[0] for r in con.execute(
+            f'SELECT "{config.COL_SEXE}" FROM "{config.dim_sexe_table}" WHERE "{config.COL_SEXE}" IS NOT NULL '
+            f'GROUP BY "{config.COL_SEXE}" ORDER BY MIN(sexe), "{config.COL_SEXE}"')],
+        "ages": sorted(distinctes(config.COL_TRANCHE_AGE, config.dim_age_table), key=_rang_age),
+        **{niveau: distinctes(col_code, config.dim_territoire_table) for niveau, col_code in NIVEAUX_TERRITOIRE.items()},
+    }
+
+    with con:
+        con.execute(f'DROP TABLE IF EXISTS "{config.catalogue_table}"')
+        con.execute(f'CREATE TABLE "{config.catalogue_table}" (cle TEXT PRIMARY KEY, valeur TEXT NOT NULL)')
+        con.executemany(f'INSERT INTO "{config.catalogue_table}" VALUES (?, ?)',
+                        [(cle, json.dumps(valeur, ensure_ascii=False)) for cle, valeur in catalogue.items()])
+    print(f"Catalogue construit en {time.perf_counter() - debut:.2f} s : {len(arbre)} pathologies de niveau 1, "
+          f"{len(catalogue['annees'])} années, {len(catalogue['sexes'])} sexes, {len(catalogue['ages'])} classes d'âge")
@@ -1,9 +1,38 @@
 import pandas as pd
+import numpy as np
 import sqlite3 
 import zipfile
 import io
 import os
+import time
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import config  
+import data.manifest as manifest
+import data.optimisation_bdd as optimisation_bdd
+import data.agregats as agregats
+import data.schema_etoile as schema_etoile
+
+# Colonnes textuelles du CSV : lues en str pour éviter les problèmes avec '999'
+# et pour que chaque bloc lu en streaming garde les mêmes types
+COLONNES_TEXTE = ['patho_niv1', 'patho_niv2', 'patho_niv3', 'top', 'cla_age_5', 'libelle_classe_age',
+                  'libelle_sexe', 'region', 'dept', 'Niveau prioritaire']
+
+# Mappings pour sexe
+Mapping_sexe = {1: 'hommes', 2: 'femmes', 9: 'tous sexes'}
+inv_sexe_mapping = {v: k for k, v in Mapping_sexe.items()}
+
+# Mapping Âge 
+Mapping_Age = {'de 0 à 4 ans': '0-4', 'de 5 à 9 ans': '5-9', 'de 10 à 14 ans': '10-14',
+               'de 15 à 19 ans': '15-19', 'de 20 à 24 ans': '20-24', 'de 25 à 29 ans': '25-29',
+               'de 30 à 34 ans': '30-34', 'de 35 à 39 ans': '35-39', 'de 40 à 44 ans': '40-44',
+               'de 45 à 49 ans': '45-49', 'de 50 à 54 ans': '50-54', 'de 55 à 59 ans': '55-59',
+               'de 60 à 64 ans': '60-64', 'de 65 à 69 ans': '65-69', 'de 70 à 74 ans': '70-74',
+               'de 75 à 79 ans': '75-79', 'de 80 à 84 ans': '80-84', 'de 85 à 89 ans': '85-89', 
+               'de 90 à 94 ans': '90-94', 'plus de 95 ans': '95+', 'tous âges': 'tsage'}
+inv_age_mapping = {v: k for k, v in Mapping_Age.items()} 
+
 
 #fonction de chargement de données depuis un fichier zip
 def load_data_from_zip(zip_path, csv_filename):    
@@ -16,25 +45,73 @@ def load_data_from_zip(zip_path, csv_filename):
     return df
 
 
+def iter_data_from_zip(zip_path, csv_filename, chunksize=config.CHUNK_SIZE):
+    """
+    Lit le CSV directement dans le ZIP, par blocs de `chunksize` lignes,
+    sans jamais décompresser le fichier entier en mémoire.
+    """
+    print(f"Lecture en streaming du fichier : {os.path.abspath(zip_path)} (blocs de {chunksize} lignes)")
+    with zipfile.ZipFile(zip_path) as z:
+        with z.open(csv_filename) as f:
+            reader = pd.read_csv(f, sep=";", dtype={col: str for col in COLONNES_TEXTE}, chunksize=chunksize)
+            for chunk in reader:
+                # Types fixes d'un bloc à l'autre (un bloc avec des NaN ne doit pas passer annee en float)
+                chunk['annee'] = pd.to_numeric(chunk['annee'], errors='coerce').astype('Int64')
+                if 'tri' in chunk.columns:
+                    chunk['tri'] = pd.to_numeric(chunk['tri'], errors='coerce').astype(float)
+                yield chunk
+
+
+def _empreintes_lignes_brutes(chunk):
+    """
+    Empreinte 64 bits de chaque ligne brute. Les colonnes numériques sont ramenées en float
+    pour que l'empreinte ne dépende pas du type deviné par pandas pour le bloc.
+    """
+    normalise = chunk.copy()
+    for col in normalise.columns:
+        if col not in COLONNES_TEXTE:
+            normalise[col] = pd.to_numeric(normalise[col], errors='coerce').astype(float)
+    return pd.util.hash_pandas_object(normalise, index=False).to_numpy()
+
+
+class EmpreintesAnnees:
+    """
+    Empreinte du contenu brut de chaque partition `annee`, calculée au fil des blocs lus.
+    Une année dont l'empreinte n'a pas changé n'a pas besoin d'être renettoyée.
+    """
+    def __init__(self):
+        self.hash = {}
+        self.nb_lignes = {}
+
+    def ajouter(self, chunk):
+        empreintes = _empreintes_lignes_brutes(chunk)
+        for annee, positions in chunk.groupby('annee').indices.items():
+            annee = int(annee)
+            if annee not in self.hash:
+                self.hash[annee] = hashlib.sha1(f"schema-{config.SCHEMA_VERSION}".encode())
+                self.nb_lignes[annee] = 0
+            self.hash[annee].update(empreintes[positions].tobytes())
+            self.nb_lignes[annee] += len(positions)
+
+    def resultat(self):
+        return {annee: (h.hexdigest(), self.nb_lignes[annee]) for annee, h in self.hash.items()}
+
+
 def clean_data(df):
     
     if df.empty:
         return df
 
-    # Mappings pour sexe
-    Mapping_sexe = {1: 'hommes', 2: 'femmes', 9: 'tous sexes'}
-    inv_sexe_mapping = {v: k for k, v in Mapping_sexe.items()}
-    
-    # Mapping Âge 
-    Mapping_Age = {'de 0 à 4 ans': '0-4', 'de 5 à 9 ans': '5-9', 'de 10 à 14 ans': '10-14',
-                   'de 15 à 19 ans': '15-19', 'de 20 à 24 ans': '20-24', 'de 25 à 29 ans': '25-29',
-                   'de 30 à 34 ans': '30-34', 'de 35 à 39 ans': '35-39', 'de 40 à 44 ans': '40-44',
-                   'de 45 à 49 ans': '45-49', 'de 50 à 54 ans': '50-54', 'de 55 à 59 ans': '55-59',
-                   'de 60 à 64 ans': '60-64', 'de 65 à 69 ans': '65-69', 'de 70 à 74 ans': '70-74',
-                   'de 75 à 79 ans': '75-79', 'de 80 à 84 ans': '80-84', 'de 85 à 89 ans': '85-89', 
-                   'de 90 à 94 ans': '90-94', 'plus de 95 ans': '95+', 'tous âges': 'tsage'}
-    inv_age_mapping = {v: k for k, v in Mapping_Age.items()} 
+    df_clean = _nettoyer_lignes(df)
+    df_clean.drop_duplicates(keep='first', inplace=True)
+    return _finaliser_colonnes(df_clean)
 
+
+def _nettoyer_lignes(df):
+    """
+    Partie ligne à ligne du nettoyage (tout ce qui précède la suppression des doublons).
+    Chaque ligne est traitée indépendamment des autres : on peut donc l'appliquer bloc par bloc.
+    """
     df['Ntop'] = pd.to_numeric(df['Ntop'], errors='coerce').astype('Int64')
     df['Npop'] = pd.to_numeric(df['Npop'], errors='coerce').astype('Int64')
     df['prev'] = pd.to_numeric(df['prev'], errors='coerce').astype(float)
@@ -90,9 +167,12 @@ def clean_data(df):
         df_clean['Niveau prioritaire'] = df_clean['Niveau prioritaire'].astype(str).str.strip()
         df_clean.loc[df_clean['Niveau prioritaire'].str.len() > 0, 'Niveau prioritaire'] = \
             df_clean.loc[df_clean['Niveau prioritaire'].str.len() > 0, 'Niveau prioritaire'].str[0]
-    
-    df_clean.drop_duplicates(keep='first', inplace=True)
-    
+
+    return df_clean
+
+
+def _finaliser_colonnes(df_clean):
+    """Remplissages appliqués après la suppression des doublons."""
     categ_cols_final = ['Niveau prioritaire']
     for col in categ_cols_final:
         if col in df_clean.columns:
@@ -101,18 +181,124 @@ def clean_data(df):
     return df_clean
 
 
+def nombre_workers(n_workers=None):
+    """Nombre de processus de nettoyage : argument, sinon config, sinon nombre de cœurs."""
+    return max(1, n_workers or config.CLEANING_WORKERS or os.cpu_count() or 1)
+
+
+def _nettoyer_bloc(bloc):
+    """Nettoie un bloc brut ; renvoie aussi son nombre de lignes brutes (pour les statistiques)."""
+    return len(bloc), _nettoyer_lignes(bloc)
+
+
+def _nettoyer_blocs(blocs, n_workers):
+    """
+    Applique _nettoyer_bloc à chaque bloc et renvoie les résultats dans l'ordre d'entrée.
+    Avec plusieurs workers, les blocs sont nettoyés dans un pool de processus ; au plus
+    2 blocs par worker sont en cours à un instant donné pour garder la mémoire bornée.
+    """
+    if n_workers <= 1:
+        for bloc in blocs:
+            yield _nettoyer_bloc(bloc)
+        return
+
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        en_cours = deque()
+        for bloc in blocs:
+            en_cours.append(pool.submit(_nettoyer_bloc, bloc))
+            if len(en_cours) >= 2 * n_workers:
+                yield en_cours.popleft().result()
+        while en_cours:
+            yield en_cours.popleft().result()
+
+
+def clean_data_parallel(df, n_workers=None):
+    """
+    Même résultat que clean_data (lignes, ordre, index et types identiques), mais le
+    nettoyage ligne à ligne est réparti sur plusieurs processus. Seule la suppression
+    des doublons, qui a besoin de toutes les lignes, reste faite dans le processus principal.
+    """
+    if df.empty:
+        return df
+
+    n_workers = nombre_workers(n_workers)
+    n_partitions = max(n_workers, -(-len(df) // config.CHUNK_SIZE))
+    bornes = np.linspace(0, len(df), n_partitions + 1).astype(int)
+    # copies : _nettoyer_lignes modifie son bloc, qui ne doit pas être une vue sur le DataFrame de l'appelant
+    partitions = (df.iloc[debut:fin].copy() for debut, fin in zip(bornes[:-1], bornes[1:]))
+
+    df_clean = pd.concat([bloc for _, bloc in _nettoyer_blocs(partitions, n_workers)])
+    df_clean.drop_duplicates(keep='first', inplace=True)
+    return _finaliser_colonnes(df_clean)
+
+
+def comparer_nettoyages(df, n_workers=None):
+    """Vérifie que le nettoyage parallèle donne exactement le même DataFrame que clean_data."""
+    attendu = clean_data(df.copy())
+    obtenu = clean_data_parallel(df.copy(), n_workers)
+    try:
+        pd.testing.assert_frame_equal(obtenu, attendu)
+    except AssertionError as e:
+        print(f"Le nettoyage parallèle diffère du nettoyage séquentiel : {e}")
+        return False
+    print(f"Nettoyages identiques ({len(attendu)} lignes).")
+    return True
+
+
+class DedoublonneurBlocs:
+    """
+    Supprime les doublons d'un bloc à l'autre grâce à une empreinte 64 bits par ligne.
+    Les empreintes des lignes déjà écrites sont gardées par SQLite dans une table temporaire
+    (clé primaire, fichier temporaire) et non en mémoire : la mémoire du processus reste celle
+    d'un bloc, quel que soit le nombre de lignes distinctes du fichier.
+    """
+    def __init__(self, con):
+        self.con = con
+        with con:
+            con.execute("CREATE TEMP TABLE IF NOT EXISTS lignes_vues (empreinte INTEGER PRIMARY KEY)")
+            con.execute("CREATE TEMP TABLE IF NOT EXISTS bloc_courant (empreinte INTEGER)")
+            con.execute("DELETE FROM temp.lignes_vues")
+
+    def filtrer(self, df):
+        # empreintes signées : SQLite ne stocke que des entiers 64 bits signés
+        empreintes = pd.util.hash_pandas_object(df, index=False).to_numpy().view(np.int64)
+
+        # Première occurrence de chaque ligne à l'intérieur du bloc
+        _, premieres = np.unique(empreintes, return_index=True)
+        garder = np.zeros(len(df), dtype=bool)
+        garder[premieres] = True
+
+        # Lignes déjà écrites par un bloc précédent, puis ajout de celles du bloc
+        with self.con:
+            self.con.executemany("INSERT INTO temp.bloc_courant VALUES (?)",
+                                 ((int(e),) for e in empreintes[premieres]))
+            deja_vues = np.array([e for e, in self.con.execute(
+                "SELECT empreinte FROM temp.bloc_courant JOIN temp.lignes_vues USING (empreinte)")], dtype=np.int64)
+            self.con.execute("INSERT OR IGNORE INTO temp.lignes_vues SELECT empreinte FROM temp.bloc_courant")
+            self.con.execute("DELETE FROM temp.bloc_courant")
+        if len(deja_vues):
+            garder &= ~np.isin(empreintes, deja_vues)
+
+        return df.take(np.flatnonzero(garder))
+
+
 def run_cleaning_process():
-    db_dir = os.path.dirname(config.db_name)
-    if db_dir: 
-        os.makedirs(db_dir, exist_ok=True)
-        print(f"Dossier de sortie vérifié/créé : {db_dir}")
+    if config.INGEST_MODE == "streaming":
+        if config.INCREMENTAL_REBUILD:
+            return run_incremental_cleaning_process()
+        return run_streaming_cleaning_process()
+
+    _preparer_dossier_bdd()
 
     # Connexion à la base de données 
-    con = sqlite3.connect(config.db_name)
+    con = optimisation_bdd.connexion_ecriture()
 
     try:
         df = load_data_from_zip(config.zip_file_name, config.csv_in_zip)
-        df_cleaned = clean_data(df)
+        if nombre_workers() > 1:
+            df_cleaned = clean_data_parallel(df)
+        else:
+            df_cleaned = clean_data(df)
         if df_cleaned.empty:
             print("Attention : Le DataFrame est vide après le nettoyage. Aucune donnée à enregistrer.")
             return
@@ -122,11 +308,216 @@ def run_cleaning_process():
         con.close()
         return
     
-    con = sqlite3.connect(config.db_name)
+    con = optimisation_bdd.connexion_ecriture()
     try:
-        df_cleaned.to_sql(config.table_name, con, if_exists='replace', index=False)
+        with con:
+            schema_etoile.supprimer(con)
+            schema_etoile.EcrivainEtoile(con).ecrire(df_cleaned)
+            schema_etoile.creer_vue(con)
+        # Les empreintes par année ne correspondent plus à rien : la prochaine
+        # reconstruction incrémentale repartira de zéro
+        con.execute(f'DROP TABLE IF EXISTS "{config.partitions_table}"')
+        _terminer_construction(con, len(df_cleaned), complete=True)
         print(f"Cleaned data saved to database at {config.db_name} in table {config.table_name}")
     except Exception as e:
         print(f"Erreur lors de l'enregistrement dans la base de données : {e}")
     finally:
         con.close()
+
+
+def _preparer_dossier_bdd():
+    db_dir = os.path.dirname(config.db_name)
+    if db_dir: 
+        os.makedirs(db_dir, exist_ok=True)
+        print(f"Dossier de sortie vérifié/créé : {db_dir}")
+
+
+def _ecrire_blocs(con, ecrivain, blocs, n_workers):
+    """
+    Nettoie les blocs bruts, supprime les doublons d'un bloc à l'autre et les ajoute au schéma
+    en étoile par `ecrivain` (schema_etoile.EcrivainEtoile), un bloc par transaction.
+    Renvoie le nombre de lignes lues et écrites.
+    """
+    dedoublonneur = DedoublonneurBlocs(con)
+    n_lues, n_ecrites = 0, 0
+    debut = time.perf_counter()
+
+    print(f"Nettoyage sur {n_workers} processus")
+    for n_brutes, bloc in _nettoyer_blocs(blocs, n_workers):
+        n_lues += n_brutes
+        bloc = _finaliser_colonnes(dedoublonneur.filtrer(bloc))
+        if not bloc.empty:
+            with con:
+                ecrivain.ecrire(bloc)
+            n_ecrites += len(bloc)
+        duree = time.perf_counter() - debut
+        print(f"  {n_lues} lignes lues, {n_ecrites} lignes écrites ({n_lues / duree:,.0f} lignes/s)")
+
+    duree = max(time.perf_counter() - debut, 1e-9)
+    print(f"{n_ecrites} lignes écrites en {duree:.1f} s ({n_lues / duree:,.0f} lignes lues/s)")
+    return n_lues, n_ecrites
+
+
+def _terminer_construction(con, nb_lignes, complete, annees=None):
+    """
+    Agrégats précalculés (seulement pour `annees` si précisé), index, ANALYZE (et VACUUM
+    pour une construction complète), puis manifeste : la base n'est déclarée à jour
+    qu'une fois optimisée.
+    Une reconstruction partielle ne recalcule que ce qui dépend des années remplacées
+    (ANALYZE échantillonné). L'instantané en colonnes n'est pas écrit ici : get_data l'écrit
+    au démarrage, seulement dans le mode qui le lit.
+    """
+    with con:
+        schema_etoile.purger_dimensions(con)
+    # Index d'abord : le GROUP BY du cube suit l'ordre des index de la carte
+    optimisation_bdd.creer_index(con)
+    agregats.construire_cube(con, None if complete else annees)
+    agregats.construire_resumes(con, None if complete else annees)
+    agregats.construire_catalogue(con)
+    optimisation_bdd.optimiser_base(con, vacuum=complete, partielle=not complete)
+    with con:
+        manifest.ecrire_manifest(con, nb_lignes)
+    optimisation_bdd.rapport_plan_requetes(con)
+
+
+def _lire_empreintes(con):
+    """Empreintes enregistrées par la dernière construction : {annee: (empreinte, version)}."""
+    try:
+        rows = con.execute(f'SELECT annee, empreinte, version FROM "{config.partitions_table}"').fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    return {annee: (empreinte, version) for annee, empreinte, version in rows}
+
+
+def _ecrire_empreintes(con, empreintes):
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{config.partitions_table}" (
+            annee INTEGER PRIMARY KEY, empreinte TEXT, nb_lignes_brutes INTEGER, version INTEGER
+        )""")
+    con.executemany(
+        f'INSERT OR REPLACE INTO "{config.partitions_table}" VALUES (?, ?, ?, ?)',
+        [(annee, empreinte, nb, config.SCHEMA_VERSION) for annee, (empreinte, nb) in empreintes.items()]
+    )
+
+
+def _nombre_lignes_connu(con):
+    """Nombre de lignes de la table d'après le manifeste ; COUNT(*) seulement s'il est absent."""
+    precedent = manifest.lire_manifest(config.db_name)
+    if precedent is not None and precedent["schema_version"] == config.SCHEMA_VERSION:
+        return precedent["nb_lignes"]
+    return con.execute(f'SELECT COUNT(*) FROM "{config.faits_table}"').fetchone()[0]
+
+
+def _table_existe(con, table):
+    return con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone() is not None
+
+
+def run_streaming_cleaning_process(chunksize=config.CHUNK_SIZE, n_workers=None):
+    """
+    Nettoyage en streaming : le CSV est lu par blocs dans le ZIP, chaque bloc est nettoyé,
+    dédoublonné par rapport aux blocs précédents puis ajouté à la base dans sa propre transaction.
+    La mémoire utilisée dépend de la taille des blocs, pas de celle du fichier.
+    Les blocs sont nettoyés par un pool de processus ; ce processus reste le seul à écrire en base.
+    Les empreintes par année sont calculées au passage pour les reconstructions incrémentales.
+    """
+    n_workers = nombre_workers(n_workers)
+    _preparer_dossier_bdd()
+
+    # Les blocs sont écrits dans des tables temporaires : l'ancien schéma reste lisible
+    # tant que l'ingestion n'est pas terminée
+    suffixe = "_construction"
+    con = optimisation_bdd.connexion_ecriture()
+    empreintes = EmpreintesAnnees()
+
+    def blocs_avec_empreintes():
+        for chunk in iter_data_from_zip(config.zip_file_name, config.csv_in_zip, chunksize):
+            empreintes.ajouter(chunk)
+            yield chunk
+
+    try:
+        with con:
+            schema_etoile.supprimer(con, suffixe)
+        ecrivain = schema_etoile.EcrivainEtoile(con, suffixe)
+        _, n_ecrites = _ecrire_blocs(con, ecrivain, blocs_avec_empreintes(), n_workers)
+
+        if n_ecrites == 0:
+            print("Attention : Le DataFrame est vide après le nettoyage. Aucune donnée à enregistrer.")
+            with con:
+                schema_etoile.supprimer(con, suffixe)
+            return
+
+        with con:
+            con.execute("BEGIN")
+            schema_etoile.renommer(con, suffixe)
+            con.execute(f'DROP TABLE IF EXISTS "{config.partitions_table}"')
+            _ecrire_empreintes(con, empreintes.resultat())
+        _terminer_construction(con, n_ecrites, complete=True)
+
+        print(f"Cleaned data saved to database at {config.db_name} in table {config.table_name}")
+    except Exception as e:
+        print(f"Une erreur critique est survenue dans le processus de nettoyage : {e}")
+    finally:
+        con.close()
+
+
+def run_incremental_cleaning_process(chunksize=config.CHUNK_SIZE, n_workers=None):
+    """
+    Reconstruction incrémentale par partition `annee` : une première lecture du ZIP calcule
+    l'empreinte de chaque année, puis seules les années nouvelles ou modifiées sont supprimées
+    et renettoyées. Sans empreintes exploitables (première construction, changement de
+    schéma), on refait une construction complète.
+    """
+    n_workers = nombre_workers(n_workers)
+    _preparer_dossier_bdd()
+    con = optimisation_bdd.connexion_ecriture()
+
+    try:
+        anciennes = _lire_empreintes(con)
+        if (not anciennes or not _table_existe(con, config.faits_table)
+                or any(version != config.SCHEMA_VERSION for _, version in anciennes.values())):
+            con.close()
+            print("Pas d'empreintes par année exploitables : reconstruction complète.")
+            return run_streaming_cleaning_process(chunksize, n_workers)
+
+        print("Calcul des empreintes par année...")
+        empreintes = EmpreintesAnnees()
+        for chunk in iter_data_from_zip(config.zip_file_name, config.csv_in_zip, chunksize):
+            empreintes.ajouter(chunk)
+        nouvelles = empreintes.resultat()
+
+        a_refaire = sorted(a for a, (empreinte, _) in nouvelles.items() if anciennes.get(a, (None,))[0] != empreinte)
+        a_supprimer = sorted(set(anciennes) - set(nouvelles))
+        nb_lignes = _nombre_lignes_connu(con)
+        if not a_refaire and not a_supprimer:
+            # Contenu identique : seul le manifeste change (empreinte du nouveau ZIP), en gardant
+            # l'identifiant de construction pour que caches et instantané restent valides
+            print("Aucune année modifiée : la base nettoyée est à jour.")
+            precedent = manifest.lire_manifest(config.db_name)
+            with con:
+                manifest.ecrire_manifest(con, nb_lignes, empreinte_build=precedent and precedent.get("empreinte_build"))
+            return
+
+        print(f"Années à reconstruire : {a_refaire} ; années retirées : {a_supprimer}")
+        annees = a_refaire + a_supprimer
+        marqueurs = ", ".join("?" * len(annees))
+        # Les empreintes (et le manifeste) sont retirés en même temps que les lignes : si
+        # l'ingestion est interrompue, ces années seront reconstruites au prochain lancement
+        with con:
+            manifest.effacer_manifest(con)
+            con.execute(f'DELETE FROM "{config.partitions_table}" WHERE annee IN ({marqueurs})', annees)
+            cur = con.execute(f'DELETE FROM "{config.faits_table}" WHERE {config.COL_ANNEE} IN ({marqueurs})', annees)
+            nb_lignes -= cur.rowcount
+
+        blocs = iter_data_from_zip(config.zip_file_name, config.csv_in_zip, chunksize)
+        blocs = (chunk.take(np.flatnonzero(chunk['annee'].isin(a_refaire))) for chunk in blocs)
+        ecrivain = schema_etoile.EcrivainEtoile(con)
+        _, n_ecrites = _ecrire_blocs(con, ecrivain, (b for b in blocs if not b.empty), n_workers)
+
+        with con:
+            _ecrire_empreintes(con, {a: nouvelles[a] for a in a_refaire})
+        _terminer_construction(con, nb_lignes + n_ecrites, complete=False, annees=annees)
+        print(f"Cleaned data saved to database at {config.db_name} in table {config.table_name}")
+    except Exception as e:
+        print(f"Une erreur critique est survenue dans le processus de nettoyage : {e}")
+    finally:
+        con.close()
@@ -1,18 +1,26 @@
 import os
+import sqlite3
 import zipfile
 import config
 import data.clean_data as clean_data
-import sqlite3
+import data.manifest as manifest
+import data.instantane as instantane
 # --- Étape 1 : Vérification du ZIP et du CSV brut ---
 def check_raw_data(zip_path: str = config.zip_file_name, csv_inside: str = config.csv_in_zip):
     """
     Vérifie la présence du fichier ZIP brut et du CSV à l'intérieur.
+    Si le ZIP est celui décrit par le manifeste de la base, il n'est pas rouvert.
     """
     if not os.path.exists(zip_path):
         print(f" Le fichier brut est introuvable : {zip_path}")
         print(" Télécharge-le ou place-le dans le dossier data/rawdata/")
         return False
 
+    m = manifest.lire_manifest()
+    if manifest.manifest_correspond_zip(m, zip_path) and m["csv_membre"] == csv_inside:
+        print(f" Le fichier brut {csv_inside} est bien présent dans {zip_path} (d'après le manifeste)")
+        return True
+
     try:
         with zipfile.ZipFile(zip_path, "r") as z:
             if csv_inside in z.namelist():
@@ -27,54 +35,57 @@ def check_raw_data(zip_path: str = config.zip_file_name, csv_inside: str = confi
         return False
 
 
+def _ecrire_instantane_si_besoin(cleaned_db_path, empreinte):
+    """
+    Instantané en colonnes de la construction `empreinte`, écrit sans toucher à la base s'il
+    manque ou date d'une autre construction ; seulement dans le mode qui le lit
+    (instantane.instantane_utilise) : ailleurs ce serait une lecture complète de la table pour rien.
+    """
+    if not instantane.instantane_utilise() or instantane.instantane_a_jour(empreinte):
+        return
+    con = sqlite3.connect(f"file:{cleaned_db_path}?mode=ro", uri=True)
+    try:
+        instantane.ecrire_instantane(con)
+    finally:
+        con.close()
+
+
 # --- Étape 2 : Vérification ou génération du .db nettoyé ---
-def ensure_cleaned_data(cleaned_db_path: str = config.db_name, table_name: str = config.table_name):
+def ensure_cleaned_data(cleaned_db_path: str = config.db_name):
     """
-    Vérifie si la base nettoyée (.db) existe et contient des données.
-    Si non, exécute la fonction de nettoyage directement.
+    Décide à partir du manifeste de construction, sans parcourir la table, si la base
+    nettoyée est à jour, périmée (ZIP brut modifié) ou à reconstruire.
+    Si besoin, exécute la fonction de nettoyage directement.
     """
     os.makedirs(os.path.dirname(cleaned_db_path), exist_ok=True)
-    is_data_ready = False
 
-    if os.path.exists(cleaned_db_path):
-        try:
-            con = sqlite3.connect(cleaned_db_path)
-            # Vérifier si la table existe et si elle contient des lignes
-            cursor = con.execute(f"SELECT COUNT(*) FROM {table_name}")
-            row_count = cursor.fetchone()[0]
-            con.close()
-            
-            if row_count > 0:
-                size_mb = os.path.getsize(cleaned_db_path) / (1024 * 1024)
-                print(f" Base de données déjà prête ({size_mb:.2f} Mo, {row_count} lignes)")
-                is_data_ready = True
-            else:
-                print(" Base trouvée mais ne contient pas de données ou la table est vide. Relancement du nettoyage...")
-        except sqlite3.OperationalError:
-            print(" Base trouvée mais illisible ou table manquante. Relancement du nettoyage...")
-        except Exception as e:
-            print(f" Erreur inattendue lors de la vérification de la base : {e}. Relancement du nettoyage...")
+    etat = manifest.etat_base(cleaned_db_path)
+    if etat == manifest.FRESH:
+        m = manifest.lire_manifest(cleaned_db_path)
+        size_mb = os.path.getsize(cleaned_db_path) / (1024 * 1024)
+        print(f" Base de données déjà prête ({size_mb:.2f} Mo, {m['nb_lignes']} lignes, construite le {m['date_construction']})")
+        _ecrire_instantane_si_besoin(cleaned_db_path, m["empreinte_build"])
+        return True
 
-    if not is_data_ready:
-        print(" Base nettoyée introuvable ou vide. Lancement du nettoyage...")
-        try:
-            # Exécuter directement la fonction de nettoyage
-            clean_data.run_cleaning_process()
-            # Revérifier après le nettoyage
-            if os.path.exists(cleaned_db_path):
-                con = sqlite3.connect(cleaned_db_path)
-                cursor = con.execute(f"SELECT COUNT(*) FROM {table_name}")
-                row_count = cursor.fetchone()[0]
-                con.close()
-                if row_count > 0:
-                     print("Nettoyage terminé avec succès et base remplie.")
-                     is_data_ready = True
-                else:
-                    print("Attention : Le nettoyage s'est exécuté, mais la base reste vide.")
-            else:
-                print("Erreur : Le script de nettoyage n'a pas créé le fichier de base de données.")
-        except Exception as e:
-            print(f" Erreur lors de l’exécution du script de nettoyage : {e}")
-            is_data_ready = False
+    if etat == manifest.STALE:
+        print(" Le fichier brut a changé depuis la dernière construction. Mise à jour de la base...")
+    else:
+        print(" Base nettoyée introuvable, vide ou construite avec un ancien schéma. Lancement du nettoyage...")
 
-    return is_data_ready
+    try:
+        # Exécuter directement la fonction de nettoyage
+        clean_data.run_cleaning_process()
+    except Exception as e:
+        print(f" Erreur lors de l’exécution du script de nettoyage : {e}")
+        return False
+
+    # Revérifier après le nettoyage (le manifeste n'est écrit que si la construction a abouti)
+    if manifest.etat_base(cleaned_db_path) == manifest.FRESH:
+        print("Nettoyage terminé avec succès et base remplie.")
+        _ecrire_instantane_si_besoin(cleaned_db_path, manifest.lire_manifest(cleaned_db_path)["empreinte_build"])
+        return True
+    if os.path.exists(cleaned_db_path):
+        print("Attention : Le nettoyage s'est exécuté, mais la base reste vide ou incomplète.")
+    else:
+        print("Erreur : Le script de nettoyage n'a pas créé le fichier de base de données.")
+    return False
@@ -0,0 +1,178 @@
+import json
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+import config
+from data.schema_etoile import DIMENSIONS
+
+# Colonnes de la page histogrammes (les autres analyses lisent les résumés en base)
+COLONNES_TEXTE = [config.COL_PATHO_NV1, config.COL_PATHO_NV2, config.COL_PATHO_NV3,
+                  config.COL_SEXE, config.COL_NV_PRIORITAIRE]
+COLONNES_NUMERIQUES = [config.COL_NTOP, config.COL_NPOP, config.COL_PREV, config.COL_TRI]
+# Ordre des lignes de l'instantané : celui d'IndexHisto, qui n'a donc rien à retrier
+ORDRE = [config.COL_SEXE, config.COL_PATHO_NV1, config.COL_PATHO_NV2, config.COL_PATHO_NV3]
+
+FICHIER_META = "meta.json"
+TAILLE_BLOC = 500_000
+
+
+def type_etroit(mini, maxi, nb_nuls, nb_decimaux, decimaux_float32_exacts=False):
+    """
+    Type le plus étroit sans perte pour une colonne numérique d'après ses bornes :
+    entier signé le plus petit qui contient [min, max] ; pour les entiers avec valeurs
+    manquantes, float32 tant qu'ils restent exacts (< 2**24), sinon float64.
+    Les décimaux restent en float64 (9.436 n'a pas de représentation float32 exacte), sauf si
+    l'appelant a vérifié que toutes les valeurs survivent à l'aller-retour float32
+    (decimaux_float32_exacts).
+    """
+    if mini is None:
+        return np.float32
+    if nb_decimaux:
+        return np.float32 if decimaux_float32_exacts else np.float64
+    if nb_nuls:
+        return np.float32 if max(abs(mini), abs(maxi)) < 2 ** 24 else np.float64
+    return next(t for t in (np.int8, np.int16, np.int32, np.int64)
+                if np.iinfo(t).min <= mini and maxi <= np.iinfo(t).max)
+
+
+def _type_codes(nb_categories):
+    return next(t for t in (np.int8, np.int16, np.int32) if nb_categories < np.iinfo(t).max)
+
+
+def lire_colonnes_faits(con, cles, mesures=COLONNES_NUMERIQUES):
+    """
+    Colonnes entières `cles` (int64, sans valeur manquante) et `mesures` (float64, NaN pour NULL)
+    de la table de faits, lues par blocs en tableaux NumPy (sans DataFrame complet), dans l'ordre des rowid.
+    """
+    colonnes = cles + mesures
+    liste = ", ".join(f'"{c}"' for c in colonnes)
+    blocs = {c: [] for c in colonnes}
+    curseur = con.execute(f'SELECT {liste} FROM "{config.faits_table}" ORDER BY rowid')
+    while True:
+        lignes = curseur.fetchmany(TAILLE_BLOC)
+        if not lignes:
+            break
+        bloc = pd.DataFrame.from_records(lignes, columns=colonnes)
+        for c in colonnes:
+            blocs[c].append(pd.to_numeric(bloc[c]).to_numpy(dtype=np.int64 if c in cles else np.float64))
+    return {c: (np.concatenate(v) if v else np.zeros(0, dtype=np.int64 if c in cles else np.float64))
+            for c, v in blocs.items()}
+
+
+def _codes_texte(con, faits):
+    """
+    Colonnes texte encodées par dictionnaire à partir des tables de dimensions :
+    {colonne: (codes, catégories triées)}, code -1 pour une valeur manquante.
+    """
+    resultat = {}
+    for dimension, (cle, attributs) in DIMENSIONS.items():
+        colonnes = [c for c in COLONNES_TEXTE if c in attributs]
+        if not colonnes:
+            continue
+        liste = ", ".join(f'"{c}"' for c in colonnes)
+        table = pd.read_sql_query(f'SELECT {cle}, {liste} FROM "{dimension}"', con)
+        ids = table[cle].to_numpy(dtype=np.int64)
+        for colonne in colonnes:
+            categories = sorted(table[colonne].dropna().unique())
+            type_codes = _type_codes(len(categories))
+            # code de chaque clé de dimension, puis code de chaque ligne par indexation
+            par_cle = np.full(ids.max() + 1 if len(ids) else 1, -1, dtype=type_codes)
+            par_cle[ids] = pd.Categorical(table[colonne], categories=categories).codes
+            resultat[colonne] = (par_cle[faits[cle]], categories)
+    return resultat
+
+
+def ecrire_instantane(con, dossier=config.INSTANTANE_DOSSIER):
+    """
+    Instantané en colonnes des données de la page histogrammes, écrit au démarrage par
+    get_data pour la construction courante quand le mode le lit : un fichier .npy par colonne (textes en codes entiers + catégories dans
+    meta.json, nombres dans leur type le plus étroit), lignes déjà triées dans l'ordre d'IndexHisto.
+    Le dashboard le projette en mémoire (np.load mmap_mode) au lieu de lire la base : pas de
+    conversion ligne à ligne, et les processus du serveur partagent les mêmes pages.
+    meta.json porte l'empreinte de la construction ; un instantané d'une autre construction est ignoré.
+    """
+    debut = time.perf_counter()
+    empreinte = con.execute(f"SELECT valeur FROM \"{config.manifest_table}\" WHERE cle = 'empreinte_build'").fetchone()
+    cles = [cle for dimension, (cle, attributs) in DIMENSIONS.items() if set(attributs) & set(COLONNES_TEXTE)]
+    faits = lire_colonnes_faits(con, cles)
+    textes = _codes_texte(con, faits)
+
+    # Tri stable par les codes (valeur manquante en dernier), comme sort_values d'IndexHisto
+    ordre = np.lexsort([np.where(textes[c][0] < 0, len(textes[c][1]), textes[c][0]) for c in reversed(ORDRE)])
+
+    temporaire = dossier + ".tmp"
+    shutil.rmtree(temporaire, ignore_errors=True)
+    os.makedirs(temporaire)
+    meta = {"empreinte_build": empreinte[0] if empreinte else None, "nb_lignes": len(ordre), "colonnes": {}}
+    for k, colonne in enumerate(COLONNES_TEXTE + COLONNES_NUMERIQUES):
+        fichier = f"{k:02d}.npy"
+        if colonne in textes:
+            codes, categories = textes[colonne]
+            np.save(os.path.join(temporaire, fichier), codes[ordre])
+            meta["colonnes"][colonne] = {"fichier": fichier, "categories": categories}
+        else:
+            valeurs = faits[colonne][ordre]
+            finies = valeurs[np.isfinite(valeurs)]
+            type_ = type_etroit(finies.min() if len(finies) else None, finies.max() if len(finies) else None,
+                                len(valeurs) - len(finies), int((finies != np.floor(finies)).sum()),
+                                np.array_equal(finies.astype(np.float32).astype(np.float64), finies))
+            np.save(os.path.join(temporaire, fichier), valeurs.astype(type_))
+            meta["colonnes"][colonne] = {"fichier": fichier}
+    with open(os.path.join(temporaire, FICHIER_META), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    # Remplacement par renommages : un processus qui a déjà projeté l'ancien instantané le garde
+    # (fichiers supprimés mais encore ouverts), les suivants lisent le nouveau
+    ancien = dossier + ".ancien"
+    shutil.rmtree(ancien, ignore_errors=True)
+    if os.path.exists(dossier):
+        os.replace(dossier, ancien)
+    os.replace(temporaire, dossier)
+    shutil.rmtree(ancien, ignore_errors=True)
+
+    taille = sum(os.path.getsize(os.path.join(dossier, f)) for f in os.listdir(dossier))
+    print(f"Instantané en colonnes écrit dans {dossier} : {len(ordre)} lignes, "
+          f"{taille / 1024 ** 2:.1f} Mo en {time.perf_counter() - debut:.1f} s")
+
+
+def instantane_utilise():
+    """L'instantané ne sert qu'à la page histogrammes en mode "memoire" sans moteur à bitmaps."""
+    return config.HISTO_MODE == "memoire" and config.FILTRE_MOTEUR != "bitmap"
+
+
+def _meta(empreinte, dossier):
+    """Description de l'instantané s'il a été écrit pour la construction `empreinte`, sinon None."""
+    try:
+        with open(os.path.join(dossier, FICHIER_META), encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if empreinte is None or meta.get("empreinte_build") != empreinte:
+        return None
+    return meta
+
+
+def instantane_a_jour(empreinte, dossier=config.INSTANTANE_DOSSIER):
+    return _meta(empreinte, dossier) is not None
+
+
+def lire_instantane(empreinte, dossier=config.INSTANTANE_DOSSIER):
+    """
+    DataFrame projeté en mémoire sur les fichiers de l'instantané, sans copie (colonnes en
+    lecture seule), ou None si l'instantané est absent ou ne correspond pas à `empreinte`.
+    """
+    meta = _meta(empreinte, dossier)
+    if meta is None:
+        return None
+
+    colonnes = {}
+    for colonne, infos in meta["colonnes"].items():
+        # vue ndarray ordinaire sur la projection (la sous-classe memmap ne se propage pas aux calculs)
+        valeurs = np.load(os.path.join(dossier, infos["fichier"]), mmap_mode="r").view(np.ndarray)
+        if "categories" in infos:
+            valeurs = pd.Categorical.from_codes(valeurs, categories=infos["categories"], validate=False)
+        colonnes[colonne] = valeurs
+    # copy=False : une colonne = un bloc pandas qui pointe sur le fichier projeté
+    return pd.DataFrame(colonnes, copy=False)
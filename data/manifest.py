@@ -0,0 +1,105 @@
+import os
+import sqlite3
+import hashlib
+import datetime
+import uuid
+import config
+
+# États possibles de la base nettoyée au démarrage
+FRESH = "fresh"        # la base correspond au ZIP brut actuel
+STALE = "stale"        # le ZIP brut a changé depuis la dernière construction
+REBUILD = "rebuild"    # pas de base, pas de manifeste ou ancien schéma
+
+
+def hash_fichier(path, taille_bloc=1024 * 1024):
+    """SHA-256 d'un fichier, lu par blocs."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloc in iter(lambda: f.read(taille_bloc), b""):
+            h.update(bloc)
+    return h.hexdigest()
+
+
+def ecrire_manifest(con, nb_lignes, zip_path=config.zip_file_name, csv_inside=config.csv_in_zip, empreinte_build=None):
+    """
+    Enregistre le manifeste de construction dans la base (à appeler dans la transaction
+    qui termine la construction) : taille, date et hash du ZIP brut, nombre de lignes,
+    version du schéma et date de construction.
+    `empreinte_build` conserve l'identifiant précédent quand le contenu de la base n'a pas
+    changé (caches et instantané restent valides) ; par défaut un nouvel identifiant est tiré.
+    """
+    stat = os.stat(zip_path)
+    zip_sha256 = hash_fichier(zip_path)
+    date_construction = datetime.datetime.now().isoformat(timespec="seconds")
+    valeurs = {
+        "zip_taille": stat.st_size,
+        "zip_mtime_ns": stat.st_mtime_ns,
+        "zip_sha256": zip_sha256,
+        "csv_membre": csv_inside,
+        "nb_lignes": nb_lignes,
+        "schema_version": config.SCHEMA_VERSION,
+        "date_construction": date_construction,
+        # Identifiant unique de cette construction (sert à invalider les caches)
+        "empreinte_build": empreinte_build or uuid.uuid4().hex,
+    }
+    effacer_manifest(con)
+    con.executemany(f'INSERT INTO "{config.manifest_table}" VALUES (?, ?)', [(k, str(v)) for k, v in valeurs.items()])
+
+
+def effacer_manifest(con):
+    """Retire le manifeste : la base sera considérée comme à reconstruire."""
+    con.execute(f'CREATE TABLE IF NOT EXISTS "{config.manifest_table}" (cle TEXT PRIMARY KEY, valeur TEXT)')
+    con.execute(f'DELETE FROM "{config.manifest_table}"')
+
+
+def lire_manifest(db_path=config.db_name):
+    """Renvoie le manifeste de la base sous forme de dict, ou None s'il n'existe pas."""
+    if not os.path.exists(db_path):
+        return None
+    try:
+        con = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            rows = con.execute(f'SELECT cle, valeur FROM "{config.manifest_table}"').fetchall()
+        finally:
+            con.close()
+    except sqlite3.Error:
+        return None
+    if not rows:
+        return None
+
+    manifest = dict(rows)
+    for cle in ("zip_taille", "zip_mtime_ns", "nb_lignes", "schema_version"):
+        manifest[cle] = int(manifest[cle])
+    return manifest
+
+
+def manifest_correspond_zip(manifest, zip_path=config.zip_file_name):
+    """Comparaison rapide (taille et date de modification) entre le manifeste et le ZIP sur disque."""
+    if manifest is None or not os.path.exists(zip_path):
+        return False
+    stat = os.stat(zip_path)
+    return stat.st_size == manifest["zip_taille"] and stat.st_mtime_ns == manifest["zip_mtime_ns"]
+
+
+def etat_base(db_path=config.db_name, zip_path=config.zip_file_name):
+    """
+    Décide si la base nettoyée est à jour sans parcourir les données :
+    seuls le manifeste et un stat() du ZIP sont lus. Le ZIP n'est hashé que si
+    sa taille ou sa date a changé (copie, touch...), pour confirmer un vrai changement.
+    """
+    manifest = lire_manifest(db_path)
+    if manifest is None or manifest["schema_version"] != config.SCHEMA_VERSION or manifest["nb_lignes"] <= 0:
+        return REBUILD
+    if not os.path.exists(zip_path) or manifest_correspond_zip(manifest, zip_path):
+        return FRESH
+    if hash_fichier(zip_path) == manifest["zip_sha256"]:
+        # Même contenu : on met à jour la date pour ne plus avoir à rehasher
+        con = sqlite3.connect(db_path)
+        try:
+            with con:
+                con.execute(f'UPDATE "{config.manifest_table}" SET valeur = ? WHERE cle = ?',
+                            (str(os.stat(zip_path).st_mtime_ns), "zip_mtime_ns"))
+        finally:
+            con.close()
+        return FRESH
+    return STALE
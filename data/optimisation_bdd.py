@@ -0,0 +1,149 @@
+import sqlite3
+import config
+from data.agregats import DIMENSIONS_CUBE, requete_cube
+from data.schema_etoile import DIMENSIONS
+
+# Index couvrant calqué sur les lectures de la table de faits : égalités sur les clés de
+# pathologie, de sexe, d'âge et l'année. La page histogrammes en mode "requete" (RequetesHisto)
+# filtre sur (patho_id, sexe_id), préfixe de l'index ; toutes les colonnes des faits y sont
+# incluses pour ne jamais lire la table.
+COLONNES_FILTRE_CARTE = ["patho_id", "sexe_id", "age_id", config.COL_ANNEE]
+COLONNES_MESURES = [config.COL_NTOP, config.COL_NPOP, config.COL_PREV]
+
+INDEX = {
+    "idx_faits_carte": COLONNES_FILTRE_CARTE + ["territoire_id"] + COLONNES_MESURES + [config.COL_TRI],
+    # suppression des partitions lors des reconstructions incrémentales
+    "idx_faits_annee": [config.COL_ANNEE],
+}
+
+
+def connexion_ecriture(db_path=config.db_name):
+    """Connexion utilisée pendant la construction de la base."""
+    con = sqlite3.connect(db_path)
+    # Sans effet si la base existe déjà (il faut alors un VACUUM, voir optimiser_base)
+    con.execute(f"PRAGMA page_size = {config.SQLITE_PAGE_SIZE}")
+    con.execute("PRAGMA synchronous = NORMAL")
+    return con
+
+
+def creer_index(con, table=config.faits_table):
+    for nom, colonnes in INDEX.items():
+        liste = ", ".join(f'"{c}"' for c in colonnes)
+        con.execute(f'CREATE INDEX IF NOT EXISTS "{nom}" ON "{table}" ({liste})')
+
+
+# Lignes échantillonnées par index pour l'ANALYZE d'une reconstruction partielle
+LIMITE_ANALYSE_PARTIELLE = 1000
+
+
+def optimiser_base(con, vacuum=False, partielle=False):
+    """
+    Termine une construction : index, statistiques de l'optimiseur (ANALYZE) et mode WAL.
+    Avec vacuum=True (reconstruction complète), la base est aussi compactée et
+    réécrite avec la taille de page configurée.
+    Avec partielle=True (quelques années remplacées), l'ANALYZE est borné par
+    PRAGMA analysis_limit : la répartition des clés change peu, un échantillon suffit.
+    """
+    creer_index(con)
+    con.commit()
+    if partielle:
+        con.execute(f"PRAGMA analysis_limit = {LIMITE_ANALYSE_PARTIELLE}")
+    if vacuum:
+        # page_size ne peut changer qu'en dehors du mode WAL, au moment d'un VACUUM
+        con.execute("PRAGMA journal_mode = DELETE")
+        con.execute(f"PRAGMA page_size = {config.SQLITE_PAGE_SIZE}")
+        con.execute("VACUUM")
+    con.execute("ANALYZE")
+    con.commit()
+    con.execute("PRAGMA analysis_limit = 0")
+    # WAL : les lecteurs du dashboard ne sont pas bloqués pendant une mise à jour
+    con.execute("PRAGMA journal_mode = WAL")
+
+
+# --- Requêtes de la page histogrammes en mode "requete" (src.utils.requetes_histo.RequetesHisto) ---
+# `where` : condition sur les clés de la sélection (patho_id, sexe_id), suivie de ses paramètres
+
+def requete_nombre_lignes(where):
+    return f'SELECT COUNT(*) FROM "{config.faits_table}" WHERE {where}'
+
+
+def requete_bornes(colonne, where):
+    return f'SELECT MIN("{colonne}"), MAX("{colonne}"), COUNT("{colonne}") FROM "{config.faits_table}" WHERE {where}'
+
+
+def requete_classes(colonne, where):
+    """
+    Effectifs par classe de même largeur (voir RequetesHisto.classes) ; paramètres ?1 = min,
+    ?2 = nbins / (max - min), ?3 = dernière classe, ?4 = largeur, puis ceux du filtre.
+    """
+    return f"""
+    SELECT classe + (x >= ?1 + (classe + 1) * ?4 AND classe < ?3) AS classe_finale, COUNT(*)
+    FROM (
+        SELECT x, estimee - (x < ?1 + estimee * ?4) AS classe
+        FROM (
+            SELECT "{colonne}" AS x, MIN(CAST(("{colonne}" - ?1) * ?2 AS INTEGER), ?3) AS estimee
+            FROM "{config.faits_table}"
+            WHERE {where} AND "{colonne}" IS NOT NULL
+        )
+    )
+    GROUP BY classe_finale
+    """
+
+
+def requete_lignes(colonnes, where):
+    """Colonnes des lignes de la sélection, avec jointure sur les seules dimensions utiles."""
+    liste = ", ".join(f'"{c}"' for c in colonnes)
+    jointures = " ".join(f'JOIN "{dimension}" USING ({cle})' for dimension, (cle, attributs) in DIMENSIONS.items()
+                         if set(attributs) & set(colonnes))
+    return f'SELECT {liste} FROM "{config.faits_table}" {jointures} WHERE {where}'
+
+
+def rapport_plan_requetes(con):
+    """
+    Affiche le plan d'exécution (EXPLAIN QUERY PLAN) des lectures du dashboard et vérifie
+    qu'elles passent par la clé primaire du cube (carte) ou par idx_faits_carte (page
+    histogrammes en mode "requete"), sans parcours complet de table ni d'index.
+    Seul le découpage en classes peut regrouper dans un B-tree temporaire : le numéro de classe
+    est calculé, et ce B-tree ne compte que nbins entrées.
+    """
+    dims_cube = ", ".join(f'"{c}"' for c in DIMENSIONS_CUBE)
+    exemple_cube = con.execute(f'SELECT {dims_cube} FROM "{config.cube_table}" LIMIT 1').fetchone()
+    # sélection de la page histogrammes : toutes les clés d'une pathologie de niveau 1, un sexe
+    exemple_histo = con.execute(f"""
+        SELECT GROUP_CONCAT(p.patho_id), (SELECT MIN(sexe_id) FROM "{config.dim_sexe_table}")
+        FROM "{config.dim_pathologie_table}" p
+        WHERE p."{config.COL_PATHO_NV1}" = (SELECT MIN("{config.COL_PATHO_NV1}") FROM "{config.dim_pathologie_table}")
+    """).fetchone()
+    if exemple_cube is None or exemple_histo[0] is None:
+        return False
+
+    pathos = [int(p) for p in str(exemple_histo[0]).split(",")]
+    where = f'"patho_id" IN ({", ".join("?" * len(pathos))}) AND "sexe_id" = ?'
+    params_histo = pathos + [exemple_histo[1]]
+    colonnes_lignes = [config.COL_NV_PRIORITAIRE, config.COL_CODE_REGION, config.COL_PREV]
+
+    # (nom, requête, paramètres, accès attendu, B-tree temporaire admis)
+    requetes = [
+        (f"cube, carte par {niveau}", requete_cube(col_code), (niveau,) + tuple(exemple_cube), "PRIMARY KEY", False)
+        for niveau, col_code in (("region", config.COL_CODE_REGION), ("departement", config.COL_CODE_DEPT))
+    ]
+    requetes += [
+        ("histogrammes, nombre de lignes", requete_nombre_lignes(where), params_histo, "COVERING INDEX idx_faits_carte", False),
+        ("histogrammes, bornes", requete_bornes(config.COL_PREV, where), params_histo, "COVERING INDEX idx_faits_carte", False),
+        ("histogrammes, classes", requete_classes(config.COL_PREV, where), [0.0, 1.0, 29, 1.0] + params_histo,
+         "COVERING INDEX idx_faits_carte", True),
+        ("histogrammes, lignes", requete_lignes(colonnes_lignes, where), params_histo, "COVERING INDEX idx_faits_carte", False),
+    ]
+
+    tout_ok = True
+    print("Plan d'exécution des requêtes du dashboard :")
+    for nom, requete, params, acces_attendu, b_tree_admis in requetes:
+        plan = [ligne[-1] for ligne in con.execute("EXPLAIN QUERY PLAN " + requete, list(params))]
+        ok = (any(acces_attendu in etape for etape in plan)
+              and not any(etape.startswith("SCAN") for etape in plan)
+              and (b_tree_admis or not any("TEMP B-TREE" in etape for etape in plan)))
+        tout_ok &= ok
+        print(f"  {nom} : {'OK' if ok else 'ATTENTION'}")
+        for etape in plan:
+            print(f"    {etape}")
+    return tout_ok
@@ -0,0 +1,134 @@
+import pandas as pd
+import config
+
+# Tables de dimensions : nom -> (clé entière, colonnes et types SQLite des attributs).
+# Chaque combinaison distincte d'attributs reçoit une clé ; la table de faits ne garde que les clés.
+DIMENSIONS = {
+    config.dim_pathologie_table: ("patho_id", {
+        config.COL_PATHO_NV1: "TEXT", config.COL_PATHO_NV2: "TEXT", config.COL_PATHO_NV3: "TEXT",
+        config.COL_TOP: "TEXT", config.COL_NV_PRIORITAIRE: "TEXT",
+    }),
+    config.dim_age_table: ("age_id", {config.COL_TRANCHE_AGE: "TEXT", config.COL_CLASSE_AGE: "TEXT"}),
+    config.dim_sexe_table: ("sexe_id", {"sexe": "INTEGER", config.COL_SEXE: "TEXT"}),
+    config.dim_territoire_table: ("territoire_id", {config.COL_CODE_REGION: "TEXT", config.COL_CODE_DEPT: "TEXT"}),
+}
+
+MESURES = {config.COL_NTOP: "INTEGER", config.COL_NPOP: "INTEGER", config.COL_PREV: "REAL", config.COL_TRI: "REAL"}
+
+# Colonnes de la vue `effectifs`, dans l'ordre de l'ancienne table
+COLONNES_VUE = [config.COL_ANNEE, config.COL_PATHO_NV1, config.COL_PATHO_NV2, config.COL_PATHO_NV3, config.COL_TOP,
+                config.COL_TRANCHE_AGE, "sexe", config.COL_CODE_REGION, config.COL_CODE_DEPT,
+                config.COL_NTOP, config.COL_NPOP, config.COL_PREV, config.COL_NV_PRIORITAIRE,
+                config.COL_CLASSE_AGE, config.COL_SEXE, config.COL_TRI]
+
+
+def _type_objet(con, nom):
+    ligne = con.execute("SELECT type FROM sqlite_master WHERE name = ?", (nom,)).fetchone()
+    return ligne[0] if ligne else None
+
+
+def supprimer(con, suffixe=""):
+    """Supprime la vue et les tables du schéma (et l'ancienne table `effectifs` non normalisée)."""
+    noms = [config.table_name + suffixe, config.faits_table + suffixe] + [d + suffixe for d in DIMENSIONS]
+    for nom in noms:
+        type_ = _type_objet(con, nom)
+        if type_ in ("table", "view"):
+            con.execute(f'DROP {type_.upper()} "{nom}"')
+
+
+def creer_tables(con, suffixe=""):
+    for dimension, (cle, attributs) in DIMENSIONS.items():
+        colonnes = ", ".join(f'"{c}" {t}' for c, t in attributs.items())
+        con.execute(f'CREATE TABLE IF NOT EXISTS "{dimension}{suffixe}" ({cle} INTEGER PRIMARY KEY, {colonnes})')
+    cles = ", ".join(f"{cle} INTEGER NOT NULL" for cle, _ in DIMENSIONS.values())
+    mesures = ", ".join(f'"{c}" {t}' for c, t in MESURES.items())
+    con.execute(f'CREATE TABLE IF NOT EXISTS "{config.faits_table}{suffixe}" '
+                f'("{config.COL_ANNEE}" INTEGER, {cles}, {mesures})')
+
+
+def creer_vue(con):
+    """Vue `effectifs` : mêmes colonnes que l'ancienne table, reconstituées par jointure."""
+    source = {config.COL_ANNEE: "f", **{c: "f" for c in MESURES}}
+    jointures = []
+    for k, (dimension, (cle, attributs)) in enumerate(DIMENSIONS.items()):
+        alias = f"d{k}"
+        source.update({c: alias for c in attributs})
+        jointures.append(f'JOIN "{dimension}" {alias} ON {alias}.{cle} = f.{cle}')
+    colonnes = ", ".join(f'{source[c]}."{c}"' for c in COLONNES_VUE)
+    con.execute(f'DROP VIEW IF EXISTS "{config.table_name}"')
+    con.execute(f'CREATE VIEW "{config.table_name}" AS SELECT {colonnes} '
+                f'FROM "{config.faits_table}" f {" ".join(jointures)}')
+
+
+def renommer(con, suffixe):
+    """Remplace le schéma courant par celui construit sous `suffixe` (à appeler dans une transaction)."""
+    supprimer(con)
+    for nom in [config.faits_table] + list(DIMENSIONS):
+        con.execute(f'ALTER TABLE "{nom}{suffixe}" RENAME TO "{nom}"')
+    creer_vue(con)
+
+
+def purger_dimensions(con):
+    """
+    Retire les lignes de dimension qui ne sont plus référencées (années supprimées).
+    NOT EXISTS s'arrête à la première ligne de faits qui utilise la clé : une clé encore
+    référencée coûte une recherche courte, pas un parcours complet de la table de faits.
+    """
+    for dimension, (cle, _) in DIMENSIONS.items():
+        con.execute(f'DELETE FROM "{dimension}" WHERE NOT EXISTS '
+                    f'(SELECT 1 FROM "{config.faits_table}" f WHERE f.{cle} = "{dimension}".{cle})')
+
+
+def _normaliser(df):
+    """Attributs en objets Python, valeurs manquantes en None : NaN et <NA> se confondent."""
+    return df.astype(object).where(df.notna(), None)
+
+
+class EcrivainEtoile:
+    """
+    Écrit des blocs nettoyés (colonnes de l'ancienne table) dans le schéma en étoile :
+    les nouvelles combinaisons d'attributs sont ajoutées aux dimensions, puis les lignes
+    sont écrites dans la table de faits avec leurs clés.
+    Les dimensions déjà en base sont chargées une fois ; elles restent en mémoire (quelques
+    milliers de lignes au plus).
+    """
+
+    def __init__(self, con, suffixe=""):
+        self.con = con
+        self.suffixe = suffixe
+        creer_tables(con, suffixe)
+        self.dimensions = {}
+        for dimension, (cle, attributs) in DIMENSIONS.items():
+            colonnes = ", ".join(f'"{c}"' for c in attributs)
+            existantes = pd.read_sql_query(f'SELECT {cle}, {colonnes} FROM "{dimension}{suffixe}"', con)
+            existantes[list(attributs)] = _normaliser(existantes[list(attributs)])
+            self.dimensions[dimension] = existantes
+
+    def _cles(self, bloc, dimension):
+        cle, attributs = DIMENSIONS[dimension]
+        colonnes = list(attributs)
+        valeurs = _normaliser(bloc[colonnes])
+        connues = self.dimensions[dimension]
+
+        nouvelles = valeurs.drop_duplicates().merge(connues, on=colonnes, how="left")
+        nouvelles = nouvelles[nouvelles[cle].isna()].drop(columns=cle)
+        if not nouvelles.empty:
+            premier = int(connues[cle].max()) + 1 if len(connues) else 1
+            nouvelles.insert(0, cle, range(premier, premier + len(nouvelles)))
+            marqueurs = ", ".join("?" * (len(colonnes) + 1))
+            self.con.executemany(f'INSERT INTO "{dimension}{self.suffixe}" VALUES ({marqueurs})',
+                                 nouvelles.itertuples(index=False, name=None))
+            connues = self.dimensions[dimension] = pd.concat([connues, nouvelles], ignore_index=True)
+
+        return valeurs.merge(connues, on=colonnes, how="left")[cle].astype("int64").to_numpy()
+
+    def ecrire(self, bloc):
+        inconnues = set(bloc.columns) - set(COLONNES_VUE)
+        if inconnues:
+            raise ValueError(f"Colonnes sans place dans le schéma en étoile : {sorted(inconnues)}")
+        faits = pd.DataFrame({config.COL_ANNEE: bloc[config.COL_ANNEE].array})
+        for dimension, (cle, _) in DIMENSIONS.items():
+            faits[cle] = self._cles(bloc, dimension)
+        for mesure in MESURES:
+            faits[mesure] = bloc[mesure].array
+        faits.to_sql(f"{config.faits_table}{self.suffixe}", self.con, if_exists="append", index=False)
@@ -1,6 +1,8 @@
 from data.get_data import ensure_cleaned_data, check_raw_data
 from src.app import create_app 
+from src.serveur import lancer
 from src.utils.lecture_BDD import lecture_BDD_histo 
+import config
 
 def main():
     print(" === Démarrage du Dashboard d'Analyse des Pathologies ===\n")
@@ -13,23 +15,29 @@ def main():
         data_ok = ensure_cleaned_data() 
         
         if data_ok:
-            print("\n 3. Chargement du DataFrame depuis la BDD...")
-            try:
-                df = lecture_BDD_histo()
-            except FileNotFoundError as e:
-                print(f" Erreur critique : {e}. Le fichier de BDD devrait exister à ce stade.")
-                return
-            except Exception as e:
-                print(f" Erreur lors du chargement du DataFrame : {e}")
-                return
+            if config.HISTO_MODE == "requete":
+                # Rien à charger : les graphiques interrogent la base à la demande
+                print("\n 3. Page histogrammes en mode requête (aucun chargement au démarrage)")
+                df = None
+            elif config.FILTRE_MOTEUR == "bitmap":
+                # Le moteur à bitmaps (construit par create_app) sert aussi la page histogrammes
+                print("\n 3. Page histogrammes servie par le moteur à bitmaps")
+                df = None
+            else:
+                print("\n 3. Chargement du DataFrame depuis la BDD...")
+                try:
+                    df = lecture_BDD_histo()
+                except FileNotFoundError as e:
+                    print(f" Erreur critique : {e}. Le fichier de BDD devrait exister à ce stade.")
+                    return
+                except Exception as e:
+                    print(f" Erreur lors du chargement du DataFrame : {e}")
+                    return
 
-            print("\n 4. Lancement du serveur Dash...")
+            print(f"\n 4. Lancement du serveur Dash (mode {config.SERVER_MODE})...")
             try:
                 app = create_app(df) 
-                
-                port_number = 8050 
-                print(f"🌍 Dashboard disponible à l'adresse : http://127.0.0.1:{port_number}/")
-                app.run(debug=True, port=port_number) 
+                lancer(app)
                 
             except Exception as e:
                 print(f" Erreur lors du lancement du serveur Dash : {e}")
@@ -7,13 +7,17 @@ from src.utils.hierarchiepatho import get_patho_hierarchy
 from src.layout.layout_cartes import LayoutCartes
 import config
 from src.layout.layout_histo import LayoutHistogrammes
+from src.utils.geometries import stock_geometries
+from src.utils.lecture_BDD import empreinte_build
+from src.utils.moteur_bitmap import moteur_bitmap
 import pandas as pd
 
 # 1. Initialisation et chargement des options statiques
-def create_app(df: pd.DataFrame):
+def create_app(df: pd.DataFrame = None):
     """
     Initialise et configure l'application Dash.
     Le DataFrame est injecté après avoir été chargé/créé par main.py.
+    Sans DataFrame (config.HISTO_MODE = "requete"), la page histogrammes interroge la base à la demande.
     """
     
     app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP] ,suppress_callback_exceptions=True)
@@ -21,18 +25,23 @@ def create_app(df: pd.DataFrame):
 
     # 1. Chargement des options statiques
     PATHOS_HIERARCHY, NIV1_OPTIONS = get_patho_hierarchy()
+    # Géométries des cartes lues et simplifiées une fois pour toutes
+    stock_geometries()
+    if config.FILTRE_MOTEUR == "bitmap":
+        # Moteur construit avant le premier clic (et, en production, avant le fork des workers)
+        moteur_bitmap(empreinte_build())
     PATHO_LEVEL_OPTIONS = [{'label': 'Niveau 1', 'value': 'patho_niv1'},
                            {'label': 'Niveau 2', 'value': 'patho_niv2'},
                            {'label': 'Niveau 3', 'value': 'patho_niv3'}]
 
-    MAP_LAYOUT = LayoutCartes.create_layout(NIV1_OPTIONS)
+    MAP_LAYOUT = LayoutCartes.create_layout(NIV1_OPTIONS, PATHOS_HIERARCHY)
     
     # HISTO_LAYOUT utilise le DF injecté.
     HISTO_LAYOUT = LayoutHistogrammes.create_layout(df, PATHO_LEVEL_OPTIONS)
 
     # 2. Enregistrement des Callbacks
     # Note: J'utilise 'register_callbacks' pour les deux par cohérence.
-    LayoutCartes.register_callback(app, PATHOS_HIERARCHY)
+    LayoutCartes.register_callback(app)
     LayoutHistogrammes.register_callbacks(app, df, PATHOS_HIERARCHY, config)
 
     # 3. Layout Principal et Routing
@@ -1,12 +1,17 @@
+import json
+import time
 from dash import dcc, html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 import config
-from src.page.cartes import creation_carte
-from src.utils.lecture_BDD import lecture_BDD_carte
+from src.page.cartes import cache_rendu, cle_rendu, creation_carte, creation_fond_carte, donnees_carte
+from src.utils.lecture_BDD import cle_selection, empreinte_build, lecture_BDD_carte, lecture_catalogue
 
 class LayoutCartes:
     @staticmethod
-    def create_layout(NIV1_OPTIONS):
+    def create_layout(NIV1_OPTIONS, PATHOS_HIERARCHY):
+        # Années, sexes et classes d'âge présents dans la base (catalogue écrit à la construction)
+        catalogue = lecture_catalogue()
+        ANNEES, SEXES, AGES = catalogue["annees"], catalogue["sexes"], catalogue["ages"]
 
         layout = html.Div([
             html.H1("Dashboard de Prévalence Hiérarchique", style={'textAlign': 'center'}),
@@ -29,8 +34,8 @@ class LayoutCartes:
                     html.Label("Année :"),
                     dcc.Dropdown(
                         id='selecteur-annee',
-                        options=[{'label': i, 'value': i} for i in config.ANNEE],
-                        value=config.ANNEE[0],
+                        options=[{'label': i, 'value': i} for i in ANNEES],
+                        value=ANNEES[0] if ANNEES else None,
                         clearable=False
                     ),
                 ], style={'width': '24%', 'display': 'inline-block'}),
@@ -38,8 +43,8 @@ class LayoutCartes:
                     html.Label("Sexe :"),
                     dcc.Dropdown(
                         id='selecteur-sexe',
-                        options=[{'label': i, 'value': i} for i in config.SEXE],
-                        value=config.SEXE[-1],
+                        options=[{'label': i, 'value': i} for i in SEXES],
+                        value=SEXES[-1] if SEXES else None,
                         clearable=False
                     ),
                 ], style={'width': '24%', 'display': 'inline-block'}),
@@ -47,8 +52,8 @@ class LayoutCartes:
                     html.Label("Âge :"),
                     dcc.Dropdown(
                         id='selecteur-age',
-                        options=[{'label': i, 'value': i} for i in config.AGE],
-                        value=config.AGE[-1],
+                        options=[{'label': i, 'value': i} for i in AGES],
+                        value=AGES[-1] if AGES else None,
                         clearable=False
                     ),
                 ], style={'width': '24%', 'display': 'inline-block'}),
@@ -86,45 +91,69 @@ class LayoutCartes:
             html.H3(id='titre-carte', style={'textAlign': 'center', 'marginTop': '10px'}),
 
             # Carte
-            html.Iframe(id='carte-dynamique', style={"width": "100%", "height": "650px", "border": "none"})
+            html.Iframe(id='carte-dynamique', style={"width": "100%", "height": "650px", "border": "none"}),
+
+            # Mode "donnees" : valeurs de la sélection, transmises à la carte déjà affichée
+            dcc.Store(id='carte-donnees'),
+            dcc.Store(id='carte-donnees-transmises'),
+
+            # Hiérarchie des pathologies envoyée une fois au navigateur, qui en déduit les menus chaînés.
+            # Listes de paires [nom, enfants] plutôt qu'objets JS : l'ordre des menus est garanti.
+            dcc.Store(id='hierarchie-pathos', data=[
+                [niv1, [[niv2, niv3_list] for niv2, niv3_list in niv2_dict.items()]]
+                for niv1, niv2_dict in PATHOS_HIERARCHY.items()
+            ]),
         ])
 
         return layout
 
     @staticmethod
-    def register_callback(app, PATHOS_HIERARCHY):
-        @app.callback(
+    def register_callback(app):
+        # Menus chaînés résolus dans le navigateur à partir de la hiérarchie stockée dans la page :
+        # aucun aller-retour serveur, qui attendrait derrière les calculs de figures
+        app.clientside_callback(
+            """
+            function(niv1, hierarchie) {
+                var noeud = (typeof niv1 === 'string' && hierarchie) ? hierarchie.find(function(e) { return e[0] === niv1; }) : null;
+                if (!noeud) { return [[], null]; }
+                var niv2_list = noeud[1].map(function(e) { return e[0]; });
+                var options = niv2_list.map(function(v) { return {label: v, value: v}; });
+                return [options, niv2_list.length ? niv2_list[0] : null];
+            }
+            """,
             [Output('selecteur-patho-niv2', 'options'),
              Output('selecteur-patho-niv2', 'value')],
-            [Input('selecteur-patho-niv1', 'value')]
+            [Input('selecteur-patho-niv1', 'value')],
+            [State('hierarchie-pathos', 'data')]
         )
-        def set_patho_niv2_options(selected_niv1):
-            if not selected_niv1 or not isinstance(selected_niv1, str):
-                return [], None
-            if selected_niv1 in PATHOS_HIERARCHY:
-                niv2_list = list(PATHOS_HIERARCHY[selected_niv1].keys())
-                options = [{'label': i, 'value': i} for i in niv2_list]
-                default_value = niv2_list[0] if niv2_list else None
-                return options, default_value
-            return [], None
 
-        @app.callback(
+        app.clientside_callback(
+            """
+            function(niv1, niv2, hierarchie) {
+                if (typeof niv1 !== 'string' || typeof niv2 !== 'string' || !hierarchie) { return [[], null]; }
+                var noeud1 = hierarchie.find(function(e) { return e[0] === niv1; });
+                var noeud2 = noeud1 ? noeud1[1].find(function(e) { return e[0] === niv2; }) : null;
+                if (!noeud2) { return [[], null]; }
+                var niv3_list = noeud2[1];
+                var options = niv3_list.map(function(v) { return {label: v, value: v}; });
+                return [options, niv3_list.length ? niv3_list[0] : null];
+            }
+            """,
             [Output('selecteur-patho-niv3', 'options'),
              Output('selecteur-patho-niv3', 'value')],
             [Input('selecteur-patho-niv1', 'value'),
-             Input('selecteur-patho-niv2', 'value')]
+             Input('selecteur-patho-niv2', 'value')],
+            [State('hierarchie-pathos', 'data')]
         )
-        def set_patho_niv3_options(selected_niv1, selected_niv2):
-            if not selected_niv1 or not isinstance(selected_niv1, str) or \
-               not selected_niv2 or not isinstance(selected_niv2, str):
-                return [], None
-            if selected_niv1 in PATHOS_HIERARCHY and selected_niv2 in PATHOS_HIERARCHY[selected_niv1]:
-                niv3_list = PATHOS_HIERARCHY[selected_niv1][selected_niv2]
-                options = [{'label': i, 'value': i} for i in niv3_list]
-                default_value = niv3_list[0] if niv3_list else None
-                return options, default_value
-            return [], None
 
+        if config.MAP_MODE == "donnees":
+            LayoutCartes._register_callbacks_donnees(app)
+        else:
+            LayoutCartes._register_callbacks_html(app)
+
+    @staticmethod
+    def _register_callbacks_html(app):
+        """Ancien mode : un document Folium complet est reconstruit à chaque interaction."""
         @app.callback(
             [Output('titre-carte', 'children'),
              Output('carte-dynamique', 'srcDoc')],
@@ -139,14 +168,82 @@ class LayoutCartes:
         def mettre_a_jour_carte(carte, annee, patho_niv1, patho_niv2, patho_niv3, sexe, age):
             if patho_niv1 is None:
                 return "", ""
-
-            # Lecture BDD
-            df_filtre = lecture_BDD_carte(carte, annee, patho_niv1, patho_niv2, patho_niv3, sexe, age)
+            debut = time.perf_counter()
 
             # Création du titre dynamique
             titre = f"Prévalence moyenne (%) - {patho_niv1} ({sexe}, {annee})"
 
-            # Création de la carte
-            carte_html = creation_carte(carte, df_filtre, titre_legende=titre)
+            # Document déjà rendu pour cette sélection et cette construction de la base ?
+            cle = cle_rendu(selection=cle_selection(carte, annee, patho_niv1, patho_niv2, patho_niv3, sexe, age),
+                            build=empreinte_build())
+            carte_html = cache_rendu().get(cle)
+            if carte_html is None:
+                # Lecture BDD
+                df_filtre = lecture_BDD_carte(carte, annee, patho_niv1, patho_niv2, patho_niv3, sexe, age)
+
+                # Création de la carte
+                carte_html = creation_carte(carte, df_filtre, titre_legende=titre)
+                cache_rendu().put(cle, carte_html)
+
+            LayoutCartes._mesure("html", len(carte_html.encode()), debut)
+            return titre, carte_html
+
+    @staticmethod
+    def _register_callbacks_donnees(app):
+        """
+        Mode "donnees" : le document de la carte (fond et géométries) n'est envoyé que
+        lorsque le type de carte change ; les autres interactions n'envoient que les valeurs
+        par territoire, que le navigateur applique à la couche déjà affichée.
+        """
+        @app.callback(
+            Output('carte-dynamique', 'srcDoc'),
+            Input('selecteur-carte', 'value')
+        )
+        def afficher_fond_carte(carte):
+            debut = time.perf_counter()
+            fond = creation_fond_carte(carte)
+            LayoutCartes._mesure("fond de carte", len(fond.encode()), debut)
+            return fond
+
+        @app.callback(
+            [Output('titre-carte', 'children'),
+             Output('carte-donnees', 'data')],
+            [Input('selecteur-carte', 'value'),
+             Input('selecteur-annee', 'value'),
+             Input('selecteur-patho-niv1', 'value'),
+             Input('selecteur-patho-niv2', 'value'),
+             Input('selecteur-patho-niv3', 'value'),
+             Input('selecteur-sexe', 'value'),
+             Input('selecteur-age', 'value')]
+        )
+        def mettre_a_jour_carte(carte, annee, patho_niv1, patho_niv2, patho_niv3, sexe, age):
+            if patho_niv1 is None:
+                return "", None
+            debut = time.perf_counter()
+
+            df_filtre = lecture_BDD_carte(carte, annee, patho_niv1, patho_niv2, patho_niv3, sexe, age)
+            titre = f"Prévalence moyenne (%) - {patho_niv1} ({sexe}, {annee})"
+            donnees = donnees_carte(carte, df_filtre, titre_legende=titre)
+
+            LayoutCartes._mesure("données", len(json.dumps(donnees).encode()), debut)
+            return titre, donnees
+
+        # Transmission des valeurs au document de la carte, dans le navigateur
+        app.clientside_callback(
+            """
+            function(donnees) {
+                if (!donnees) { return window.dash_clientside.no_update; }
+                window.donneesCarte = donnees;
+                var iframe = document.getElementById('carte-dynamique');
+                if (iframe && iframe.contentWindow) { iframe.contentWindow.postMessage(donnees, window.location.origin); }
+                return Date.now();
+            }
+            """,
+            Output('carte-donnees-transmises', 'data'),
+            Input('carte-donnees', 'data')
+        )
 
-            return titre, carte_html
\ No newline at end of file
+    @staticmethod
+    def _mesure(mode, taille, debut):
+        if config.MAP_LOG_MESURES:
+            print(f"[carte] {mode} : {taille / 1024:.1f} Ko envoyés, {1000 * (time.perf_counter() - debut):.1f} ms côté serveur")
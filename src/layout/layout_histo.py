@@ -1,9 +1,16 @@
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go
 import plotly.express as px
 from dash import dcc, html
+import dash_bootstrap_components as dbc
 import config
 import pandas as pd
+from src.page.histo import histogramme, nuage_tendance
+from src.utils.index_histo import IndexHisto
+from src.utils.requetes_histo import BitmapHisto, RequetesHisto
+from src.utils.lecture_BDD import (lecture_catalogue, lecture_resume_age_sexe, lecture_resume_annees,
+                                   lecture_resume_correlations, lecture_resume_regions)
 
 class LayoutHistogrammes:
 
@@ -55,9 +62,27 @@ class LayoutHistogrammes:
         'fontSize': '1.8rem'
     }
 
+    @staticmethod
+    def section(section_id, titre, graph_ids):
+        """
+        Section repliable (dbc.Accordion, repliée au départ) ; sa propriété `active_item`, renvoyée
+        par le navigateur à chaque ouverture ou fermeture, déclenche le calcul de ses graphiques.
+        """
+        return dbc.Accordion(id=section_id, start_collapsed=True, always_open=True, flush=True,
+                             style={'marginTop': '40px', 'marginBottom': '20px'}, children=[
+            dbc.AccordionItem(
+                item_id=section_id,
+                title=html.H2(titre, style={**LayoutHistogrammes.SECTION_TITLE_STYLE, 'marginTop': 0, 'marginBottom': 0}),
+                children=[html.Div(style=LayoutHistogrammes.GRAPH_CARD_STYLE, children=[dcc.Graph(id=graph_id)])
+                          for graph_id in graph_ids],
+            ),
+        ])
+
     @staticmethod
     def create_layout(df, PATHO_LEVEL_OPTIONS):
-        SEXE_OPTIONS = sorted(df[config.COL_SEXE].dropna().unique()) if config.COL_SEXE in df.columns else []
+        # Sexes et pathologies de chaque niveau : catalogue précalculé, quel que soit le mode
+        catalogue = lecture_catalogue()
+        SEXE_OPTIONS = sorted(catalogue["sexes"])
 
         return html.Div(style=LayoutHistogrammes.MAIN_STYLE, children=[
             html.H1("Dashboard Pathologies : Analyses Détaillées", style=LayoutHistogrammes.HEADER_STYLE),
@@ -76,6 +101,11 @@ class LayoutHistogrammes:
                 html.Div(style=LayoutHistogrammes.CONTROL_ITEM_STYLE, children=[
                     html.Label("Choisir une pathologie :", style={'fontWeight': 'bold', 'color': '#4B5563'}),
                     dcc.Dropdown(id='patho-dropdown', style={'width': '100%'}),
+                    # valeurs triées de chaque niveau, pour le menu résolu dans le navigateur
+                    dcc.Store(id='valeurs-niveaux-patho', data={
+                        niveau: catalogue[niveau]
+                        for niveau in (config.COL_PATHO_NV1, config.COL_PATHO_NV2, config.COL_PATHO_NV3)
+                    }),
                 ]),
                 html.Div(style=LayoutHistogrammes.CONTROL_ITEM_STYLE, children=[
                     html.Label("Choisir le sexe :", style={'fontWeight': 'bold', 'color': '#4B5563'}),
@@ -94,25 +124,29 @@ class LayoutHistogrammes:
             html.Div(style=LayoutHistogrammes.GRAPH_CARD_STYLE, children=[dcc.Graph(id='graph-ntop')]),
             html.Div(style=LayoutHistogrammes.GRAPH_CARD_STYLE, children=[dcc.Graph(id='graph-prev')]),
 
+            # Sections suivantes repliées : leurs graphiques ne sont calculés qu'à l'ouverture
             # ANALYSE TEMPORELLE
-            html.H2("Analyse Temporelle", style=LayoutHistogrammes.SECTION_TITLE_STYLE),
-            html.Div(style=LayoutHistogrammes.GRAPH_CARD_STYLE, children=[dcc.Graph(id='graph-time-series')]),
+            LayoutHistogrammes.section('section-temporelle', "Analyse Temporelle", ['graph-time-series']),
 
             # SECTION 3: Corrélations
-            html.H2("Corrélations et Priorité", style=LayoutHistogrammes.SECTION_TITLE_STYLE),
-            html.Div(style=LayoutHistogrammes.GRAPH_CARD_STYLE, children=[dcc.Graph(id='graph-scatter')]),
-            html.Div(style=LayoutHistogrammes.GRAPH_CARD_STYLE, children=[dcc.Graph(id='graph-priority')]),
+            LayoutHistogrammes.section('section-correlations', "Corrélations et Priorité", ['graph-scatter', 'graph-priority']),
 
             # ANALYSES COMPLÉMENTAIRES
-            html.H2("Analyses complémentaires", style=LayoutHistogrammes.SECTION_TITLE_STYLE),
-            html.Div(style=LayoutHistogrammes.GRAPH_CARD_STYLE, children=[dcc.Graph(id='graph-treemap-region')]),
-            html.Div(style=LayoutHistogrammes.GRAPH_CARD_STYLE, children=[dcc.Graph(id='graph-heatmap-age-sexe')]),
-            #html.Div(style=LayoutHistogrammes.GRAPH_CARD_STYLE, children=[dcc.Graph(id='graph-density-prev-ntop')]),
-            html.Div(style=LayoutHistogrammes.GRAPH_CARD_STYLE, children=[dcc.Graph(id='graph-corr-matrix')]),
+            # ('graph-density-prev-ntop' désactivé)
+            LayoutHistogrammes.section('section-complementaires', "Analyses complémentaires",
+                                       ['graph-treemap-region', 'graph-heatmap-age-sexe', 'graph-corr-matrix']),
         ])
 
     @staticmethod
     def register_callbacks(app, df, PATHO_LEVEL_OPTIONS, config):
+        # Mode "memoire" : lignes regroupées une fois pour toutes par (niveau de pathologie, valeur, sexe).
+        # Mode "requete" (df = None) : chaque graphique interroge la base pour sa seule sélection.
+        # config.FILTRE_MOTEUR = "bitmap" : sélections filtrées par le moteur à bitmaps, df n'est pas utilisé.
+        if config.FILTRE_MOTEUR == "bitmap":
+            source = BitmapHisto()
+        else:
+            source = IndexHisto(df) if df is not None else RequetesHisto()
+
         def create_empty_figure(title_text):
             fig = go.Figure().update_layout(
                 title=title_text,
@@ -128,116 +162,130 @@ class LayoutHistogrammes:
             )
             return fig
 
-        # Dropdown pathologie
-        @app.callback(
+        # Dropdown pathologie : résolu dans le navigateur à partir des valeurs stockées dans la page
+        app.clientside_callback(
+            """
+            function(niveau, valeurs_niveaux) {
+                var valeurs = (valeurs_niveaux && valeurs_niveaux[niveau]) || [];
+                var options = valeurs.map(function(v) { return {label: v, value: v}; });
+                return [options, valeurs.length ? valeurs[0] : null];
+            }
+            """,
             Output('patho-dropdown', 'options'),
             Output('patho-dropdown', 'value'),
-            Input('patho-level-dropdown', 'value')
-        )
-        def update_patho_dropdown(selected_level_col_name):
-            if selected_level_col_name not in df.columns:
-                return [], None
-            unique_pathos = sorted(df[selected_level_col_name].dropna().unique())
-            options = [{'label': p, 'value': p} for p in unique_pathos]
-            initial_value = unique_pathos[0] if unique_pathos else None
-            return options, initial_value
-
-        # Callback graphiques
-        @app.callback(
-            Output('graph-tri', 'figure'),
-            Output('graph-ntop', 'figure'),
-            Output('graph-prev', 'figure'),
-            Output('graph-scatter', 'figure'),
-            Output('graph-time-series', 'figure'),
-            Output('graph-priority', 'figure'),
-            Output('graph-treemap-region', 'figure'),
-            Output('graph-heatmap-age-sexe', 'figure'),
-            #Output('graph-density-prev-ntop', 'figure'),
-            Output('graph-corr-matrix', 'figure'),
             Input('patho-level-dropdown', 'value'),
-            Input('patho-dropdown', 'value'),
-            Input('sexe-dropdown', 'value')
+            State('valeurs-niveaux-patho', 'data')
         )
-        def update_graphs(selected_level_col_name, selected_patho, selected_sexe):
+
+        def selection(selected_level_col_name, selected_patho, selected_sexe):
+            """Sélection (niveau, pathologie, sexe) et titre commun, ou (None, titre de la figure vide)."""
             if selected_patho is None or selected_sexe is None:
-                return tuple([create_empty_figure("Sélectionnez une pathologie et un sexe")] * 10)
+                return None, "Sélectionnez une pathologie et un sexe"
 
-            df_filtered = df[
-                (df[selected_level_col_name] == selected_patho) &
-                (df[config.COL_SEXE] == selected_sexe)
-            ].copy()
+            selection_courante = (selected_level_col_name, selected_patho, selected_sexe)
+            if source.nombre_lignes(*selection_courante) == 0:
+                return None, "Aucune donnée pour cette sélection"
 
             level_name = next(
                 (item['label'] for item in PATHO_LEVEL_OPTIONS if isinstance(item, dict) and item.get('value') == selected_level_col_name),
                 selected_level_col_name
             )
-            base_title = f"{selected_patho} ({level_name}, {selected_sexe})"
+            return selection_courante, f"{selected_patho} ({level_name}, {selected_sexe})"
+
+        def panneau(graph_id, section=None):
+            """
+            Un callback par graphique : chaque figure est calculée dans sa propre requête et
+            s'affiche dès qu'elle est prête. Les graphiques d'une section repliée (section =
+            id du dbc.Accordion) ne sont calculés qu'à son ouverture.
+            La figure reçoit la sélection (niveau, pathologie, sexe) : elle demande à `source`
+            (ou aux résumés précalculés en base) uniquement ce qu'elle affiche.
+            """
+            entrees = [Input('patho-level-dropdown', 'value'),
+                       Input('patho-dropdown', 'value'),
+                       Input('sexe-dropdown', 'value')]
+            if section is not None:
+                entrees.append(Input(section, 'active_item'))
+
+            def decorateur(construire):
+                @app.callback(Output(graph_id, 'figure'), *entrees)
+                def mettre_a_jour(selected_level_col_name, selected_patho, selected_sexe, ouvert=True):
+                    if not ouvert:
+                        raise PreventUpdate
+                    selection_courante, base_title = selection(selected_level_col_name, selected_patho, selected_sexe)
+                    if selection_courante is None:
+                        return create_empty_figure(base_title)
+                    return construire(selection_courante, base_title)
+                return construire
+            return decorateur
 
-            if df_filtered.empty:
-                empty_fig = create_empty_figure("Aucune donnée pour cette sélection")
-                return tuple([empty_fig] * 10)
+        # Histogrammes (classes calculées côté serveur)
+        @panneau('graph-tri')
+        def fig_tri(selection_courante, base_title):
+            return histogramme(*source.classes(*selection_courante, config.COL_TRI, 30),
+                               f"Distribution du tri - {base_title}", '#3B82F6', config.COL_TRI)
 
-            # Histogrammes
-            fig_tri = px.histogram(df_filtered, x='tri', nbins=30, title=f"Distribution du tri - {base_title}", color_discrete_sequence=['#3B82F6'])
-            fig_ntop = px.histogram(df_filtered, x=config.COL_NTOP, nbins=30, title=f"Distribution du Ntop - {base_title}", color_discrete_sequence=['#F59E0B'])
-            fig_prev = px.histogram(df_filtered, x=config.COL_PREV, nbins=30, title=f"Distribution de la prévalence - {base_title}", color_discrete_sequence=['#10B981'])
+        @panneau('graph-ntop')
+        def fig_ntop(selection_courante, base_title):
+            return histogramme(*source.classes(*selection_courante, config.COL_NTOP, 30),
+                               f"Distribution du Ntop - {base_title}", '#F59E0B', config.COL_NTOP)
 
-            # Scatter Ntop vs Prev
-            fig_scatter = px.scatter(df_filtered, x=config.COL_NTOP, y=config.COL_PREV, trendline="ols", title=f"Corrélation : Prévalence vs Ntop - {base_title}")
+        @panneau('graph-prev')
+        def fig_prev(selection_courante, base_title):
+            return histogramme(*source.classes(*selection_courante, config.COL_PREV, 30),
+                               f"Distribution de la prévalence - {base_title}", '#10B981', config.COL_PREV)
 
-            # Série temporelle
+        # Série temporelle
+        @panneau('graph-time-series', section='section-temporelle')
+        def fig_time_series(selection_courante, base_title):
             COL_ANNEE = 'annee'
-            if COL_ANNEE in df_filtered.columns:
-                df_time = df_filtered.groupby(COL_ANNEE, as_index=False).agg(
-                    mean_prev=(config.COL_PREV, 'mean'),
-                    total_ntop=(config.COL_NTOP, 'sum')
-                )
-                fig_time_series = px.line(df_time, x=COL_ANNEE, y='mean_prev', title=f"Évolution de la Prévalence Moyenne (Année) - {base_title}", markers=True, color_discrete_sequence=['#DC2626']).update_layout(yaxis_title="Prévalence Moyenne")
-            else:
-                fig_time_series = create_empty_figure("Série Temporelle : Colonne 'annee' introuvable")
-
-            # Niveau Prioritaire
+            df_time = lecture_resume_annees(*selection_courante)
+            return px.line(df_time, x=COL_ANNEE, y='mean_prev', title=f"Évolution de la Prévalence Moyenne (Année) - {base_title}", markers=True, color_discrete_sequence=['#DC2626']).update_layout(yaxis_title="Prévalence Moyenne")
+
+        # Scatter Ntop vs Prev
+        @panneau('graph-scatter', section='section-correlations')
+        def fig_scatter(selection_courante, base_title):
+            df_filtered = source.lignes(*selection_courante, [config.COL_NTOP, config.COL_PREV])
+            return nuage_tendance(df_filtered, config.COL_NTOP, config.COL_PREV, f"Corrélation : Prévalence vs Ntop - {base_title}",
+                                  budget=config.SCATTER_MAX_POINTS)
+
+        # Niveau Prioritaire
+        @panneau('graph-priority', section='section-correlations')
+        def fig_priority(selection_courante, base_title):
             COL_NV_PRIORITAIRE = getattr(config, 'COL_NV_PRIORITAIRE', 'Niveau prioritaire')
-            if COL_NV_PRIORITAIRE in df_filtered.columns:
-                fig_priority = px.box(df_filtered, x=COL_NV_PRIORITAIRE, y=config.COL_PREV, title=f"Prévalence par Niveau Prioritaire - {base_title}", color_discrete_sequence=['#7C3AED']).update_xaxes(categoryorder='category ascending')
-            else:
-                fig_priority = create_empty_figure(f"Analyse Prioritaire : Colonne '{COL_NV_PRIORITAIRE}' introuvable")
-
-            # Treemap régions
-            if config.COL_CODE_REGION in df_filtered.columns:
-                df_region_avg = df_filtered.groupby(config.COL_CODE_REGION, as_index=False)[config.COL_PREV].mean()
-                fig_treemap = px.treemap(df_region_avg, path=[config.COL_CODE_REGION], values=config.COL_PREV,
-                                         color=config.COL_PREV, color_continuous_scale='Viridis',
-                                         title=f"Treemap prévalence par région - {base_title}")
-            else:
-                fig_treemap = create_empty_figure("Colonne région introuvable")
-
-            # Heatmap âge x sexe
-            if config.COL_SEXE in df_filtered.columns and 'libelle_classe_age' in df_filtered.columns:
-                df_heat = df_filtered.groupby(['libelle_classe_age', config.COL_SEXE], as_index=False)[config.COL_PREV].mean()
-                fig_heatmap = px.density_heatmap(df_heat, x='libelle_classe_age', y=config.COL_SEXE, z=config.COL_PREV,
-                                                 color_continuous_scale='Cividis', title=f"Heatmap Prévalence par âge et sexe - {base_title}")
-            else:
-                fig_heatmap = create_empty_figure("Colonnes âge ou sexe introuvables")
-
-            # Density plot Prev vs Ntop
-            #fig_density = px.density_contour(df_filtered, x=config.COL_NTOP, y=config.COL_PREV, title=f"Densité Prévalence vs Ntop - {base_title}")
-
-            # Matrice de corrélation
-            corr_cols = [config.COL_NTOP, 'Npop', config.COL_PREV, 'tri']
-            df_corr = df_filtered[corr_cols].corr()
-            fig_corr_matrix = go.Figure(data=go.Heatmap(z=df_corr.values, x=corr_cols, y=corr_cols, colorscale='Viridis'))
-            fig_corr_matrix.update_layout(title=f"Matrice de corrélation - {base_title}")
-
-            return (
-                fig_tri,
-                fig_ntop,
-                fig_prev,
-                fig_scatter,
-                fig_time_series,
-                fig_priority,
-                fig_treemap,
-                fig_heatmap,
-                #fig_density,
-                fig_corr_matrix
-            )
\ No newline at end of file
+            if COL_NV_PRIORITAIRE not in source.colonnes:
+                return create_empty_figure(f"Analyse Prioritaire : Colonne '{COL_NV_PRIORITAIRE}' introuvable")
+            df_filtered = source.lignes(*selection_courante, [COL_NV_PRIORITAIRE, config.COL_PREV])
+            return px.box(df_filtered, x=COL_NV_PRIORITAIRE, y=config.COL_PREV, title=f"Prévalence par Niveau Prioritaire - {base_title}", color_discrete_sequence=['#7C3AED']).update_xaxes(categoryorder='category ascending')
+
+        # Treemap régions
+        @panneau('graph-treemap-region', section='section-complementaires')
+        def fig_treemap(selection_courante, base_title):
+            df_region_avg = lecture_resume_regions(*selection_courante)
+            if df_region_avg.empty:
+                return create_empty_figure("Colonne région introuvable")
+            return px.treemap(df_region_avg, path=[config.COL_CODE_REGION], values=config.COL_PREV,
+                              color=config.COL_PREV, color_continuous_scale='Viridis',
+                              title=f"Treemap prévalence par région - {base_title}")
+
+        # Heatmap âge x sexe
+        @panneau('graph-heatmap-age-sexe', section='section-complementaires')
+        def fig_heatmap(selection_courante, base_title):
+            df_heat = lecture_resume_age_sexe(*selection_courante)
+            if df_heat.empty:
+                return create_empty_figure("Colonnes âge ou sexe introuvables")
+            return px.density_heatmap(df_heat, x='libelle_classe_age', y=config.COL_SEXE, z=config.COL_PREV,
+                                      color_continuous_scale='Cividis', title=f"Heatmap Prévalence par âge et sexe - {base_title}")
+
+        # Density plot Prev vs Ntop
+        #fig_density = px.density_contour(df_filtered, x=config.COL_NTOP, y=config.COL_PREV, title=f"Densité Prévalence vs Ntop - {base_title}")
+
+        # Matrice de corrélation
+        @panneau('graph-corr-matrix', section='section-complementaires')
+        def fig_corr_matrix(selection_courante, base_title):
+            df_corr = lecture_resume_correlations(*selection_courante)
+            if df_corr is None:
+                return create_empty_figure("Aucune donnée pour cette sélection")
+            corr_cols = list(df_corr.columns)
+            fig = go.Figure(data=go.Heatmap(z=df_corr.values, x=corr_cols, y=corr_cols, colorscale='Viridis'))
+            fig.update_layout(title=f"Matrice de corrélation - {base_title}")
+            return fig
@@ -1,16 +1,51 @@
+import functools
 import folium
-import geopandas as gpd
+import numpy as np
+import pandas as pd
+from branca.element import MacroElement
+from folium.elements import JSCSSMixin
+from jinja2 import Template
 import config
+from src.utils.cache_disque import CacheDisque, cle_contenu
+from src.utils.geometries import stock_geometries
+from src.utils.topojson import encoder_json
+
+# À incrémenter à chaque changement du rendu (code, gabarit, styles) : les documents déjà
+# en cache disque ne correspondent plus et ne seront plus lus
+VERSION_RENDU = 2
+
+_cache_rendu = None
+
+
+def cache_rendu():
+    """Cache disque des documents de carte, commun à tous les processus du serveur."""
+    global _cache_rendu
+    if _cache_rendu is None:
+        _cache_rendu = CacheDisque(config.CACHE_RENDU_DOSSIER, config.CACHE_RENDU_MAX_OCTETS)
+    return _cache_rendu
+
+
+def cle_rendu(**selection):
+    """
+    Clé d'un document : sélection, version du rendu, fichiers GeoJSON chargés (date et taille)
+    et réglages de config qui le modifient.
+    """
+    return cle_contenu(
+        selection=selection,
+        version=VERSION_RENDU,
+        geometries=stock_geometries().empreinte,
+        reglages=[config.COORDS, config.MAP_ZOOM_START, config.MAP_SIMPLIFY_TOLERANCE, config.MAP_TOPOJSON_PAS],
+    )
 
 
 def creation_carte(carte,df, titre_legende="Prévalence des pathologies par département"):
     if carte not in ["departement", "region"]:
         raise ValueError("Le type de carte doit être 'departement' ou 'region'.")
+    # Géométries déjà chargées et simplifiées : on n'y joint que les valeurs de la sélection
+    gdf = stock_geometries().couche(carte)
     if carte == "region":
-        gdf = gpd.read_file(config.region_geojson)
         RO = config.COL_CODE_REGION
     if carte == "departement":
-        gdf = gpd.read_file(config.dept_geojson)
         RO = config.COL_CODE_DEPT
 
     merged = gdf.merge(df, left_on="code", right_on=RO, how="left")
@@ -50,12 +85,13 @@ def creation_carte(carte,df, titre_legende="Prévalence des pathologies par dép
         style_function=style_function,
         highlight_function=highlight_function,
         tooltip=folium.features.GeoJsonTooltip(
-            fields=["nom", "Ntop", "Npop", "prev"],
+            fields=["nom", "Ntop", "Npop", "prev", "prev_ponderee"],
             aliases=[
                 "Département : ",
                 "Total patients pris en charge : ",
                 "Population totale : ",
                 "Prévalence moyenne (%) : ",
+                "Prévalence pondérée par la population (%) : ",
             ],
             localize=True,
             sticky=False,
@@ -70,3 +106,153 @@ def creation_carte(carte,df, titre_legende="Prévalence des pathologies par dép
     m.keep_in_front(tooltip)
 
     return m.get_root().render()
+
+
+# --- Mode "donnees" : la géométrie est envoyée une seule fois, puis seules les valeurs ---
+
+# Mêmes couleurs et classes que folium.Choropleth (6 classes d'égale largeur, YlOrRd)
+PALETTE_CARTE = ['#ffffb2', '#fed976', '#feb24c', '#fd8d3c', '#f03b20', '#bd0026']
+COLONNES_DONNEES = [config.COL_NTOP, config.COL_NPOP, config.COL_PREV, "prev_ponderee"]
+
+
+class CoucheTerritoires(JSCSSMixin, MacroElement):
+    """
+    Couche des territoires dessinée dans le navigateur, recolorée à chaque message
+    {carte, titre, bornes, valeurs} reçu de la page Dash (voir LayoutCartes).
+    La géométrie arrive en TopoJSON et est décodée par topojson-client.
+    """
+    default_js = [("topojson-client", "https://cdn.jsdelivr.net/npm/topojson-client@3/dist/topojson-client.min.js")]
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var carte = {{ this._parent.get_name() }};
+            var typeCarte = {{ this.type_carte|tojson }};
+            var libelle = {{ this.libelle|tojson }};
+            var palette = {{ this.palette|tojson }};
+            var topologie = {{ this.topologie }};
+            var geometrie = topojson.feature(topologie, topologie.objects.territoires);
+            var valeurs = {};
+            var bornes = [];
+
+            function couleur(v) {
+                if (v === null || v === undefined || bornes.length < 2) return '#000000';
+                for (var i = 1; i < bornes.length - 1; i++) {
+                    if (v < bornes[i]) return palette[i - 1];
+                }
+                return palette[palette.length - 1];
+            }
+            function style(feature) {
+                var v = valeurs[feature.properties.code];
+                return {fillColor: couleur(v ? v[0] : null), fillOpacity: 0.7,
+                        color: '#000000', weight: 0.3, opacity: 0.5};
+            }
+            function nombre(v, decimales) {
+                if (v === null || v === undefined) return 'N/A';
+                return v.toLocaleString('fr-FR', {maximumFractionDigits: decimales});
+            }
+
+            var couche = L.geoJSON(geometrie, {
+                style: style,
+                onEachFeature: function(feature, layer) {
+                    layer.bindTooltip(function() {
+                        var v = valeurs[feature.properties.code] || [];
+                        return '<b>' + libelle + ' : </b>' + feature.properties.nom
+                            + '<br><b>Total patients pris en charge : </b>' + nombre(v[0], 0)
+                            + '<br><b>Population totale : </b>' + nombre(v[1], 0)
+                            + '<br><b>Prévalence moyenne (%) : </b>' + nombre(v[2], 3)
+                            + '<br><b>Prévalence pondérée par la population (%) : </b>' + nombre(v[3], 3);
+                    }, {sticky: false});
+                    layer.on('mouseover', function(e) { e.target.setStyle({weight: 1.5, fillOpacity: 0.9}); });
+                    layer.on('mouseout', function(e) { couche.resetStyle(e.target); });
+                }
+            }).addTo(carte);
+
+            var legende = L.control({position: 'topright'});
+            legende.onAdd = function() {
+                this._div = L.DomUtil.create('div');
+                this._div.style.cssText = 'background: white; padding: 6px 8px; font: 12px Arial; '
+                    + 'box-shadow: 0 0 6px rgba(0,0,0,0.3); border-radius: 4px; max-width: 260px;';
+                return this._div;
+            };
+            legende.addTo(carte);
+
+            function appliquer(donnees) {
+                if (!donnees || donnees.carte !== typeCarte) return;
+                valeurs = donnees.valeurs || {};
+                bornes = donnees.bornes || [];
+                couche.setStyle(style);
+                // Légende construite en nœuds DOM : le titre (choix des menus) n'est jamais interprété comme du HTML
+                var div = legende._div;
+                div.textContent = '';
+                L.DomUtil.create('b', '', div).textContent = donnees.titre;
+                for (var i = 0; i + 1 < bornes.length; i++) {
+                    L.DomUtil.create('br', '', div);
+                    L.DomUtil.create('i', '', div).style.cssText =
+                        'display:inline-block;width:14px;height:10px;background:' + palette[i];
+                    div.appendChild(document.createTextNode(' ' + nombre(bornes[i], 0) + ' – ' + nombre(bornes[i + 1], 0)));
+                }
+            }
+
+            // Nouvelles valeurs envoyées par la page, ou déjà publiées avant le chargement du document.
+            // Seuls les messages de la page parente, de la même origine, sont pris en compte.
+            window.addEventListener('message', function(e) {
+                if (e.source !== window.parent || e.origin !== window.location.origin) return;
+                appliquer(e.data);
+            });
+            try { appliquer(window.parent.donneesCarte); } catch (err) {}
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, carte, topologie_json):
+        super().__init__()
+        self._name = "CoucheTerritoires"
+        self.type_carte = carte
+        self.libelle = "Région" if carte == "region" else "Département"
+        self.palette = PALETTE_CARTE
+        self.topologie = topologie_json
+
+
+@functools.lru_cache(maxsize=None)
+def creation_fond_carte(carte):
+    """
+    Document de la carte envoyé une seule fois par type de carte : fond de carte et
+    géométries (TopoJSON quantifié, seuls le code et le nom sont conservés), sans aucune
+    valeur. Les valeurs arrivent ensuite par donnees_carte.
+    """
+    if carte not in ["departement", "region"]:
+        raise ValueError("Le type de carte doit être 'departement' ou 'region'.")
+    cle = cle_rendu(fond=carte)
+    document = cache_rendu().get(cle)
+    if document is None:
+        document = _rendu_fond_carte(carte)
+        cache_rendu().put(cle, document)
+    return document
+
+
+def _rendu_fond_carte(carte):
+    topologie = encoder_json(stock_geometries().couche(carte), ["code", "nom"], config.MAP_TOPOJSON_PAS)
+
+    m = folium.Map(location=config.COORDS, zoom_start=config.MAP_ZOOM_START, tiles="CartoDB Positron")
+    m.add_child(CoucheTerritoires(carte, topologie))
+    return m.get_root().render()
+
+
+def _valeur_json(v):
+    return None if pd.isna(v) else round(float(v), 4)
+
+
+def donnees_carte(carte, df, titre_legende):
+    """
+    Message compact envoyé au navigateur à chaque interaction :
+    {code territoire: [Ntop, Npop, prev, prev_ponderee]} et les bornes des classes de couleur.
+    """
+    RO = config.COL_CODE_REGION if carte == "region" else config.COL_CODE_DEPT
+    valeurs = {
+        str(ligne[0]): [_valeur_json(v) for v in ligne[1:]]
+        for ligne in df[[RO] + COLONNES_DONNEES].itertuples(index=False)
+    }
+    ntop = pd.to_numeric(df[config.COL_NTOP], errors="coerce").dropna().to_numpy(dtype=float)
+    bornes = np.histogram_bin_edges(ntop, bins=len(PALETTE_CARTE)).tolist() if len(ntop) else []
+    return {"carte": carte, "titre": titre_legende, "bornes": bornes, "valeurs": valeurs}
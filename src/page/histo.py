@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+
+def histogramme(effectifs, bornes, titre, couleur, nom_x):
+    """
+    Histogramme à partir de classes déjà calculées (IndexHisto.classes ou RequetesHisto.classes) :
+    seuls les bornes et les effectifs des classes sont envoyés au navigateur (une barre par
+    classe), quelle que soit la taille de la sélection.
+    Même rendu que px.histogram(nbins=...) : barres jointives, axe y « count ».
+    """
+    debuts, fins = bornes[:-1], bornes[1:]
+
+    fig = go.Figure(go.Bar(
+        x=(debuts + fins) / 2,
+        y=effectifs,
+        width=fins - debuts,
+        customdata=np.column_stack([debuts, fins]),
+        marker_color=couleur,
+        hovertemplate="%{customdata[0]:.4g} – %{customdata[1]:.4g}<br>count=%{y}<extra></extra>",
+    ))
+    fig.update_layout(title=titre, bargap=0, xaxis_title=nom_x, yaxis_title="count")
+    return fig
+
+
+def droite_moindres_carres(x, y):
+    """Régression linéaire y = a·x + b en forme fermée (sans statsmodels) : (a, b, r²)."""
+    x_moy, y_moy = x.mean(), y.mean()
+    dx, dy = x - x_moy, y - y_moy
+    sxx, sxy, syy = (dx * dx).sum(), (dx * dy).sum(), (dy * dy).sum()
+    if sxx == 0:
+        return 0.0, y_moy, 0.0
+    a = sxy / sxx
+    r2 = sxy * sxy / (sxx * syy) if syy > 0 else 1.0
+    return a, y_moy - a * x_moy, r2
+
+
+def echantillon_points(x, y, budget, grille=50, graine=0):
+    """
+    Indices d'au plus ~budget points représentatifs d'un nuage : le plan est découpé en
+    grille × grille cases, chaque case non vide garde au moins un point (les valeurs isolées,
+    donc les extrêmes, sont toutes conservées) et les cases denses sont échantillonnées au
+    prorata de leur effectif, ce qui préserve la densité apparente.
+    """
+    n = len(x)
+    if n <= budget:
+        return np.arange(n)
+
+    def case(v):
+        etendue = v.max() - v.min()
+        if etendue == 0:
+            return np.zeros(n, dtype=np.int64)
+        return np.minimum(((v - v.min()) / etendue * grille).astype(np.int64), grille - 1)
+
+    cases = case(x) * grille + case(y)
+    ordre = np.lexsort((np.random.default_rng(graine).random(n), cases))
+    cases_triees = cases[ordre]
+    debuts = np.flatnonzero(np.r_[True, cases_triees[1:] != cases_triees[:-1]])
+    effectifs = np.diff(np.r_[debuts, n])
+    rang = np.arange(n) - np.repeat(debuts, effectifs)   # rang aléatoire du point dans sa case
+
+    # quota par case : au moins 1, le reste du budget réparti au prorata des effectifs
+    taux = max(budget - len(debuts), 0) / n
+    quotas = np.maximum(1, np.floor(effectifs * taux).astype(np.int64))
+    garder = rang < np.repeat(quotas, effectifs)
+    return np.sort(ordre[garder])
+
+
+def nuage_tendance(df, col_x, col_y, titre, budget):
+    """
+    Nuage de points avec droite de tendance. La droite est ajustée sur toutes les lignes ;
+    au-delà de `budget` points, seul un échantillon (echantillon_points) est dessiné
+    et le graphique l'indique.
+    """
+    donnees = df[[col_x, col_y]].apply(pd.to_numeric, errors="coerce").dropna()
+    x, y = donnees[col_x].to_numpy(dtype=float), donnees[col_y].to_numpy(dtype=float)
+    indices = echantillon_points(x, y, budget)
+
+    trace = go.Scattergl if len(indices) > 1000 else go.Scatter
+    fig = go.Figure(trace(x=x[indices], y=y[indices], mode="markers", name="", showlegend=False,
+                          marker={"color": "#636EFA"},
+                          hovertemplate=f"{col_x}=%{{x}}<br>{col_y}=%{{y}}<extra></extra>"))
+
+    if len(x) >= 2:
+        a, b, r2 = droite_moindres_carres(x, y)
+        bornes_x = np.array([x.min(), x.max()])
+        fig.add_trace(go.Scatter(
+            x=bornes_x, y=a * bornes_x + b, mode="lines", showlegend=False, line={"color": "#636EFA"},
+            name="", hovertemplate=(f"<b>Tendance (moindres carrés)</b><br>{col_y} = {a:.4g} * {col_x} + {b:.4g}"
+                                    f"<br>R<sup>2</sup>={r2:.6f}<extra></extra>"),
+        ))
+
+    fig.update_layout(title=titre, xaxis_title=col_x, yaxis_title=col_y)
+    if len(indices) < len(x):
+        fig.add_annotation(
+            text=f"Échantillon de {len(indices):,} points sur {len(x):,} (tendance calculée sur toutes les lignes)".replace(",", " "),
+            xref="paper", yref="paper", x=1, y=1.02, xanchor="right", yanchor="bottom",
+            showarrow=False, font={"size": 11, "color": "#6B7280"},
+        )
+    return fig
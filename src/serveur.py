@@ -0,0 +1,78 @@
+import gc
+import os
+import config
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:   # gunicorn absent (ou Windows) : seul le serveur de développement est disponible
+    BaseApplication = None
+
+
+def _debug(defaut):
+    return defaut if config.SERVER_DEBUG is None else config.SERVER_DEBUG
+
+
+def lancer(app):
+    """Démarre le serveur choisi par config.SERVER_MODE ("developpement" ou "production")."""
+    if config.SERVER_MODE == "production":
+        if BaseApplication is not None:
+            return lancer_production(app)
+        print(" gunicorn n'est pas installé (pip install gunicorn, Linux/macOS) : serveur de développement")
+    elif config.SERVER_MODE != "developpement":
+        raise ValueError("SERVER_MODE doit être 'developpement' ou 'production'.")
+    return lancer_developpement(app)
+
+
+def lancer_developpement(app):
+    """Serveur Flask intégré : un seul processus, rechargement automatique et débogueur."""
+    print(f"🌍 Dashboard disponible à l'adresse : http://{config.SERVER_HOST}:{config.SERVER_PORT}/")
+    app.run(debug=_debug(True), host=config.SERVER_HOST, port=config.SERVER_PORT)
+
+
+class _ApplicationGunicorn(BaseApplication or object):
+    """Application gunicorn qui sert une app Dash déjà construite (au lieu d'un module à importer)."""
+
+    def __init__(self, serveur, options):
+        self.serveur = serveur
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for cle, valeur in self.options.items():
+            self.cfg.set(cle, valeur)
+
+    def load(self):
+        return self.serveur
+
+
+def _avant_fork(serveur, worker):
+    # Juste avant chaque fork (y compris pour remplacer un worker arrêté) : voir lancer_production
+    gc.collect()
+    gc.freeze()
+
+
+def lancer_production(app):
+    """
+    gunicorn, config.SERVER_WORKERS processus de config.SERVER_THREADS threads.
+    L'app (données de la page histogrammes, géométries, index) est construite une seule fois
+    dans le processus maître, avant le fork (preload_app) : les workers en partagent les pages
+    mémoire en copie à l'écriture au lieu d'en tenir chacun une copie.
+    gc.freeze() range les objets déjà créés hors de portée du ramasse-miettes, qui sinon
+    écrirait dans leurs en-têtes à chaque collecte et dupliquerait ces pages dans chaque worker.
+    """
+    workers = config.SERVER_WORKERS or os.cpu_count() or 1
+    if _debug(False):
+        # débogueur et messages d'erreur dans le navigateur ; pas de rechargement sous gunicorn
+        app.enable_dev_tools(debug=True, dev_tools_hot_reload=False)
+    options = {
+        "bind": f"{config.SERVER_HOST}:{config.SERVER_PORT}",
+        "workers": workers,
+        "worker_class": "gthread",
+        "threads": config.SERVER_THREADS,
+        "timeout": config.SERVER_TIMEOUT_S,
+        "preload_app": True,
+        "pre_fork": _avant_fork,
+    }
+    print(f"🌍 Dashboard disponible à l'adresse : http://{config.SERVER_HOST}:{config.SERVER_PORT}/ "
+          f"({workers} processus × {config.SERVER_THREADS} threads)")
+    _ApplicationGunicorn(app.server, options).run()
@@ -0,0 +1,172 @@
+import os
+import sqlite3
+import threading
+import time
+import weakref
+import pandas as pd
+import config
+
+
+class PoolConnexions:
+    """
+    Connexions SQLite en lecture seule, une par thread qui interroge la base.
+    Quand un thread se termine, sa connexion revient dans une réserve et sera reprise par
+    le thread suivant : le serveur Dash (un thread par requête) réutilise donc les mêmes
+    connexions et leur cache de requêtes préparées. Le nombre total est borné.
+    """
+
+    def __init__(self, db_path=config.db_name, max_connexions=config.DB_POOL_MAX_CONNEXIONS):
+        self.db_path = db_path
+        self.max_connexions = max_connexions
+        self._condition = threading.Condition()
+        self._reinitialiser()
+
+    def _reinitialiser(self):
+        # Après un fork, les connexions du processus parent ne doivent pas être réutilisées
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._reserve = []
+        self._nb_ouvertes = 0
+
+    def _ouvrir(self):
+        con = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False,
+                              cached_statements=256)
+        con.execute(f"PRAGMA cache_size = -{config.SQLITE_CACHE_SIZE_KB}")
+        con.execute(f"PRAGMA mmap_size = {config.SQLITE_MMAP_SIZE}")
+        return _Connexion(con, os.stat(self.db_path).st_ino)
+
+    def _en_bonne_sante(self, connexion):
+        """SELECT 1 au plus toutes les DB_POOL_HEALTH_CHECK_S secondes, et même fichier sur disque."""
+        if time.monotonic() - connexion.dernier_controle < config.DB_POOL_HEALTH_CHECK_S:
+            return True
+        try:
+            if os.stat(self.db_path).st_ino != connexion.inode:
+                return False   # la base a été recréée : la connexion lit l'ancien fichier
+            connexion.con.execute("SELECT 1").fetchone()
+        except (OSError, sqlite3.Error):
+            return False
+        connexion.dernier_controle = time.monotonic()
+        return True
+
+    def _rendre(self, connexion):
+        with self._condition:
+            if connexion.pid == self._pid:
+                self._reserve.append(connexion)
+                self._condition.notify()
+
+    def _fermer(self, connexion):
+        try:
+            connexion.con.close()
+        except sqlite3.Error:
+            pass
+        connexion.con = None
+        with self._condition:
+            if connexion.pid == self._pid:
+                self._nb_ouvertes -= 1
+                self._condition.notify()
+
+    def _emprunter(self):
+        with self._condition:
+            while not self._reserve and self._nb_ouvertes >= self.max_connexions:
+                if not self._condition.wait(timeout=config.DB_POOL_TIMEOUT_S):
+                    raise TimeoutError(f"Aucune connexion disponible vers {self.db_path} "
+                                       f"({self.max_connexions} déjà utilisées)")
+            if self._reserve:
+                return self._reserve.pop()
+            self._nb_ouvertes += 1
+        try:
+            return self._ouvrir()
+        except Exception:
+            with self._condition:
+                self._nb_ouvertes -= 1
+            raise
+
+    def connexion(self):
+        """Connexion du thread courant (ouverte ou reprise de la réserve si besoin)."""
+        if os.getpid() != self._pid:
+            self._reinitialiser()
+
+        bail = getattr(self._local, "bail", None)
+        if bail is not None and not self._en_bonne_sante(bail.connexion):
+            self._fermer(bail.connexion)
+            bail = self._local.bail = None
+
+        while bail is None:
+            connexion = self._emprunter()
+            if self._en_bonne_sante(connexion):
+                bail = self._local.bail = _Bail(self, connexion)
+            else:
+                self._fermer(connexion)
+        return bail.connexion.con
+
+
+class _Connexion:
+    def __init__(self, con, inode):
+        self.con = con
+        self.inode = inode
+        self.pid = os.getpid()
+        self.dernier_controle = time.monotonic()
+
+
+class _Bail:
+    """Rattache une connexion à un thread ; elle retourne dans la réserve quand le thread se termine."""
+
+    def __init__(self, pool, connexion):
+        self.connexion = connexion
+        weakref.finalize(self, _fin_de_bail, weakref.ref(pool), connexion)
+
+
+def _fin_de_bail(ref_pool, connexion):
+    pool = ref_pool()
+    if pool is not None and connexion.con is not None:
+        pool._rendre(connexion)
+
+
+_pools = {}
+_verrou_pools = threading.Lock()
+
+
+def pool(db_path=None):
+    """Pool partagé pour une base (par défaut config.db_name)."""
+    db_path = db_path or config.db_name
+    with _verrou_pools:
+        if db_path not in _pools:
+            _pools[db_path] = PoolConnexions(db_path)
+        return _pools[db_path]
+
+
+def valeurs_selection(valeur):
+    """Normalise une sélection (valeur seule ou liste) en liste de valeurs non nulles."""
+    valeurs = valeur if isinstance(valeur, (list, tuple, set)) else [valeur]
+    return [v for v in valeurs if v is not None]
+
+
+def condition(colonne, valeur):
+    """
+    Condition SQL paramétrée pour une sélection : `col = ?` pour une valeur,
+    `col IN (?, ?, ...)` pour une liste. Renvoie le texte SQL et la liste des paramètres.
+    """
+    valeurs = valeurs_selection(valeur)
+    if len(valeurs) == 1:
+        return f'"{colonne}" = ?', valeurs
+    return f'"{colonne}" IN ({", ".join("?" * len(valeurs))})', valeurs
+
+
+def conditions(criteres):
+    """Combine plusieurs critères {colonne: sélection} avec AND."""
+    textes, params = [], []
+    for colonne, valeur in criteres.items():
+        texte, valeurs = condition(colonne, valeur)
+        textes.append(texte)
+        params.extend(valeurs)
+    return " AND ".join(textes), params
+
+
+def lire_sql(requete, params=(), db_path=None):
+    """Exécute une requête paramétrée et renvoie un DataFrame."""
+    return pd.read_sql_query(requete, pool(db_path).connexion(), params=list(params))
+
+
+def executer(requete, params=(), db_path=None):
+    """Exécute une requête paramétrée et renvoie les lignes brutes."""
+    return pool(db_path).connexion().execute(requete, list(params)).fetchall()
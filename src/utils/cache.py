@@ -0,0 +1,68 @@
+import threading
+from collections import OrderedDict
+
+ABSENT = object()
+
+
+class CacheLRU:
+    """
+    Cache mémoire borné en nombre d'entrées et en octets, avec éviction LRU.
+    Le cache est rattaché à une empreinte de la base : quand l'empreinte change
+    (nouvelle construction), tout son contenu est jeté.
+    """
+
+    def __init__(self, max_entrees, max_octets):
+        self.max_entrees = max_entrees
+        self.max_octets = max_octets
+        self._entrees = OrderedDict()   # cle -> (valeur, taille)
+        self._octets = 0
+        self._empreinte = None
+        self._verrou = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def valider(self, empreinte):
+        """Vide le cache si la base a changé depuis que les entrées ont été calculées."""
+        with self._verrou:
+            if empreinte != self._empreinte:
+                if self._entrees:
+                    self.invalidations += 1
+                self._entrees.clear()
+                self._octets = 0
+                self._empreinte = empreinte
+
+    def get(self, cle):
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is None:
+                self.misses += 1
+                return ABSENT
+            self._entrees.move_to_end(cle)
+            self.hits += 1
+            return entree[0]
+
+    def put(self, cle, valeur, taille):
+        with self._verrou:
+            if taille > self.max_octets:
+                return
+            if cle in self._entrees:
+                self._octets -= self._entrees.pop(cle)[1]
+            self._entrees[cle] = (valeur, taille)
+            self._octets += taille
+            while len(self._entrees) > self.max_entrees or self._octets > self.max_octets:
+                _, (_, taille_evincee) = self._entrees.popitem(last=False)
+                self._octets -= taille_evincee
+                self.evictions += 1
+
+    def stats(self):
+        with self._verrou:
+            return {
+                "entrees": len(self._entrees),
+                "octets": self._octets,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
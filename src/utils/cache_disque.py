@@ -0,0 +1,155 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:   # Windows : pas de verrou entre processus pour l'éviction
+    fcntl = None
+
+
+def cle_contenu(**elements):
+    """Clé adressée par le contenu : SHA-256 des éléments qui déterminent le document."""
+    texte = json.dumps(elements, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(texte.encode()).hexdigest()
+
+
+class CacheDisque:
+    """
+    Cache de documents sur disque, partagé par tous les processus du serveur.
+    Une entrée = un fichier gzip nommé par sa clé (voir cle_contenu) ; l'écriture passe par
+    un fichier temporaire renommé, un lecteur ne voit donc jamais un fichier incomplet.
+    La date de modification sert d'horodatage LRU (mise à jour à chaque lecture) ; quand la
+    taille totale dépasse max_octets, les entrées les moins récemment lues sont supprimées.
+    """
+
+    def __init__(self, dossier, max_octets):
+        self.dossier = dossier
+        self.max_octets = max_octets
+        os.makedirs(dossier, exist_ok=True)
+        self._verrou = threading.Lock()
+        self._ecrits_depuis_eviction = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._evincer()
+
+    def _chemin(self, cle):
+        return os.path.join(self.dossier, cle[:2], cle + ".html.gz")
+
+    def get(self, cle):
+        """Document (str) associé à la clé, ou None."""
+        chemin = self._chemin(cle)
+        try:
+            with open(chemin, "rb") as f:
+                contenu = gzip.decompress(f.read()).decode()
+            os.utime(chemin)
+        except (OSError, EOFError):   # absent, ou supprimé par une éviction entre-temps
+            with self._verrou:
+                self.misses += 1
+            return None
+        with self._verrou:
+            self.hits += 1
+        return contenu
+
+    def put(self, cle, contenu):
+        donnees = gzip.compress(contenu.encode(), compresslevel=6)
+        if len(donnees) > self.max_octets:
+            return
+        chemin = self._chemin(cle)
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        descripteur, temporaire = tempfile.mkstemp(dir=os.path.dirname(chemin), suffix=".tmp")
+        try:
+            with os.fdopen(descripteur, "wb") as f:
+                f.write(donnees)
+            os.replace(temporaire, chemin)
+        except OSError:
+            if os.path.exists(temporaire):
+                os.remove(temporaire)
+            return
+
+        # Le parcours du dossier n'est fait qu'après un dixième de la taille maximale écrit
+        with self._verrou:
+            self._ecrits_depuis_eviction += len(donnees)
+            a_evincer = self._ecrits_depuis_eviction > self.max_octets // 10
+            if a_evincer:
+                self._ecrits_depuis_eviction = 0
+        if a_evincer:
+            self._evincer()
+
+    def _entrees(self):
+        entrees = []
+        for racine, _, fichiers in os.walk(self.dossier):
+            for nom in fichiers:
+                chemin = os.path.join(racine, nom)
+                try:
+                    infos = os.stat(chemin)
+                except OSError:
+                    continue
+                if nom.endswith(".tmp"):
+                    # fichier temporaire abandonné par un processus interrompu
+                    if time.time() - infos.st_mtime > 3600:
+                        _supprimer(chemin)
+                    continue
+                if nom.endswith(".html.gz"):
+                    entrees.append((infos.st_mtime, infos.st_size, chemin))
+        return entrees
+
+    def _evincer(self):
+        """Supprime les entrées les plus anciennes jusqu'à revenir à 90 % de max_octets."""
+        with _VerrouFichier(os.path.join(self.dossier, ".eviction.lock")):
+            entrees = sorted(self._entrees())
+            total = sum(taille for _, taille, _ in entrees)
+            if total <= self.max_octets:
+                return
+            cible = self.max_octets * 9 // 10
+            for _, taille, chemin in entrees:
+                if total <= cible:
+                    break
+                if _supprimer(chemin):
+                    with self._verrou:
+                        self.evictions += 1
+                total -= taille
+
+    def stats(self):
+        entrees = self._entrees()
+        with self._verrou:
+            return {
+                "entrees": len(entrees),
+                "octets": sum(taille for _, taille, _ in entrees),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def _supprimer(chemin):
+    try:
+        os.remove(chemin)
+        return True
+    except OSError:
+        return False
+
+
+class _VerrouFichier:
+    """Verrou exclusif entre processus (flock) ; sans effet là où fcntl n'existe pas."""
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self._f = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._f = open(self.chemin, "a")
+            fcntl.flock(self._f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._f is not None:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+            self._f.close()
+            self._f = None
@@ -0,0 +1,65 @@
+import os
+import threading
+import geopandas as gpd
+import config
+
+FICHIERS_GEOJSON = {"region": config.region_geojson, "departement": config.dept_geojson}
+
+
+def simplifier(gdf, tolerance):
+    """
+    Simplification qui préserve la topologie de l'ensemble de la couche : les frontières
+    communes à deux territoires sont simplifiées de la même façon (pas de trous ni de
+    chevauchements entre voisins). Repli sur une simplification polygone par polygone
+    si la version de shapely / GEOS ne le permet pas (simplify_coverage demande
+    shapely >= 2.1 et GEOS >= 3.12 ; sinon geopandas lève ImportError).
+    """
+    simplifie = gdf.copy()
+    try:
+        simplifie.geometry = gdf.geometry.simplify_coverage(tolerance)
+    except (AttributeError, ImportError, NotImplementedError):
+        simplifie.geometry = gdf.geometry.simplify(tolerance, preserve_topology=True)
+    return simplifie
+
+
+class StockGeometries:
+    """
+    Couches région et département lues une seule fois au démarrage, avec leurs versions
+    simplifiées aux tolérances de config.MAP_SIMPLIFY_TOLERANCES (en degrés).
+    La tolérance 0 correspond à la géométrie d'origine.
+    `empreinte` (date de modification et taille de chaque fichier lu) identifie les géométries
+    chargées, pour les caches des documents qui en dépendent.
+    """
+
+    def __init__(self, tolerances=config.MAP_SIMPLIFY_TOLERANCES):
+        self._couches = {}
+        self.empreinte = {}
+        for carte, chemin in FICHIERS_GEOJSON.items():
+            infos = os.stat(chemin)
+            self.empreinte[carte] = [infos.st_mtime_ns, infos.st_size]
+            gdf = gpd.read_file(chemin)
+            self._couches[(carte, 0)] = gdf
+            for tolerance in tolerances:
+                self._couches[(carte, tolerance)] = simplifier(gdf, tolerance)
+
+    def couche(self, carte, tolerance=None):
+        """GeoDataFrame (code, nom, geometry) de la carte, à ne pas modifier."""
+        if carte not in FICHIERS_GEOJSON:
+            raise ValueError("Le type de carte doit être 'departement' ou 'region'.")
+        tolerance = config.MAP_SIMPLIFY_TOLERANCE if tolerance is None else tolerance
+        if (carte, tolerance) not in self._couches:
+            raise ValueError(f"Tolérance {tolerance} non précalculée (voir config.MAP_SIMPLIFY_TOLERANCES).")
+        return self._couches[(carte, tolerance)]
+
+
+_stock = None
+_verrou = threading.Lock()
+
+
+def stock_geometries():
+    """Stock partagé, construit au premier appel (create_app l'appelle au démarrage)."""
+    global _stock
+    with _verrou:
+        if _stock is None:
+            _stock = StockGeometries()
+        return _stock
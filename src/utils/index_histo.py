@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import config
+
+
+def _deja_trie(df, cles):
+    """
+    Vrai si les lignes sont déjà dans l'ordre de sort_values(cles, na_position="last") avec un
+    index 0..n-1. Seulement pour des colonnes catégorielles (comparaison des codes).
+    """
+    if not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+        return False
+    if not all(isinstance(df[c].dtype, pd.CategoricalDtype) for c in cles):
+        return False
+    ex_aequo = np.ones(max(len(df) - 1, 0), dtype=bool)   # paires de lignes égales sur les clés déjà vues
+    for cle in cles:
+        codes = df[cle].cat.codes.to_numpy().astype(np.int64)
+        codes[codes < 0] = len(df[cle].cat.categories)   # valeur manquante en dernier
+        ecarts = np.diff(codes)
+        if (ecarts[ex_aequo] < 0).any():
+            return False
+        ex_aequo &= ecarts == 0
+    return True
+
+
+class IndexHisto:
+    """
+    Index des filtres de la page histogrammes, construit une fois au démarrage.
+    Les lignes sont triées par (sexe, patho_niv1, patho_niv2, patho_niv3) : comme la hiérarchie
+    des pathologies est emboîtée, les lignes d'un couple (valeur d'un niveau, sexe) forment
+    une plage contiguë. Une sélection se résout donc par une recherche dans un dictionnaire
+    et une tranche iloc (vue sur les données, sans parcours ni copie).
+    """
+
+    def __init__(self, df, niveaux=(config.COL_PATHO_NV1, config.COL_PATHO_NV2, config.COL_PATHO_NV3)):
+        self.niveaux = [n for n in niveaux if n in df.columns]
+        cles_tri = [config.COL_SEXE] + self.niveaux
+        if _deja_trie(df, cles_tri):
+            self.df = df   # instantané en colonnes (déjà dans cet ordre) : pas de copie
+        else:
+            self.df = df.sort_values(cles_tri, kind="stable", na_position="last").reset_index(drop=True)
+        self.colonnes = list(self.df.columns)
+
+        # (niveau, valeur, sexe) -> liste de plages [début, fin) dans self.df
+        self._plages = {}
+        n = len(self.df)
+        if n == 0:
+            return
+        codes_sexe, sexes = pd.factorize(self.df[config.COL_SEXE])
+        for niveau in self.niveaux:
+            codes, valeurs = pd.factorize(self.df[niveau])
+            change = np.ones(n, dtype=bool)
+            change[1:] = (codes[1:] != codes[:-1]) | (codes_sexe[1:] != codes_sexe[:-1])
+            debuts = np.flatnonzero(change)
+            fins = np.append(debuts[1:], n)
+            for debut, fin in zip(debuts.tolist(), fins.tolist()):
+                # valeur ou sexe manquant (code -1) : ligne non sélectionnable
+                if codes[debut] < 0 or codes_sexe[debut] < 0:
+                    continue
+                cle = (niveau, valeurs[codes[debut]], sexes[codes_sexe[debut]])
+                self._plages.setdefault(cle, []).append((debut, fin))
+
+    def valeurs(self, niveau):
+        """Valeurs distinctes (triées) d'un niveau de pathologie."""
+        return sorted({valeur for (n, valeur, _) in self._plages if n == niveau})
+
+    def selection(self, niveau, valeur, sexe):
+        """Lignes de la sélection ; le DataFrame renvoyé ne doit pas être modifié en place."""
+        plages = self._plages.get((niveau, valeur, sexe))
+        if not plages:
+            return self.df.iloc[0:0]
+        if len(plages) == 1:
+            debut, fin = plages[0]
+            return self.df.iloc[debut:fin]
+        # valeur présente sous plusieurs parents (hiérarchie non emboîtée) : quelques plages
+        return pd.concat([self.df.iloc[debut:fin] for debut, fin in plages])
+
+    def nombre_lignes(self, niveau, valeur, sexe):
+        return sum(fin - debut for debut, fin in self._plages.get((niveau, valeur, sexe), []))
+
+    def classes(self, niveau, valeur, sexe, colonne, nbins):
+        """Effectifs et bornes de nbins classes de même largeur (np.histogram) sur la sélection."""
+        valeurs = pd.to_numeric(self.selection(niveau, valeur, sexe)[colonne], errors="coerce").to_numpy(dtype=float)
+        valeurs = valeurs[np.isfinite(valeurs)]
+        if not len(valeurs):
+            return np.zeros(0, dtype=np.int64), np.zeros(1)
+        return np.histogram(valeurs, bins=nbins)
+
+    def lignes(self, niveau, valeur, sexe, colonnes):
+        """Colonnes `colonnes` des lignes de la sélection."""
+        return self.selection(niveau, valeur, sexe)[colonnes]
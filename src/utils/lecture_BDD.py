@@ -1,75 +1,265 @@
-import sqlite3
-import pandas as pd
 import config
+import json
 import os
-import ast
+import threading
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from data.agregats import VARIABLES_CORRELATION, paires_correlation, requete_cube
+from data.instantane import COLONNES_NUMERIQUES, COLONNES_TEXTE, lire_instantane, type_etroit
+from data.schema_etoile import DIMENSIONS
+from src.utils import acces_bdd
+from src.utils.cache import CacheLRU, ABSENT
+from src.utils.moteur_bitmap import moteur_bitmap
 
-def _format_sql_value(value):
+# Résultats de la carte déjà calculés, pour la construction courante de la base
+cache_carte = CacheLRU(config.CACHE_CARTE_MAX_ENTREES, config.CACHE_CARTE_MAX_OCTETS)
 
-    if isinstance(value, list):
-        values = value
-    elif isinstance(value, str) and value.startswith("[") and value.endswith("]"):
-        try:
-            values = ast.literal_eval(value)
-        except Exception:
-            values = [value]  # fallback
-    else:
-        values = [value]
 
-    cleaned = []
-    for v in values:
-        if v is None:
-            continue
-        v = str(v).replace("'", "''")  # échappement SQL
-        cleaned.append(v)
+def empreinte_build():
+    """Identifiant de la construction courante de la base (écrit dans le manifeste)."""
+    rows = acces_bdd.executer(f"SELECT valeur FROM {config.manifest_table} WHERE cle = 'empreinte_build'")
+    return rows[0][0] if rows else None
+
+
+class DictionnaireCles:
+    """
+    Dimensions du schéma en étoile (quelques milliers de lignes) gardées en mémoire pour
+    traduire une sélection du dashboard en clés entières. Rechargées quand la base change.
+    """
+
+    def __init__(self):
+        self._empreinte = ABSENT
+        self._tables = {}
+        self._verrou = threading.Lock()
+
+    def _tables_courantes(self, empreinte):
+        with self._verrou:
+            if empreinte != self._empreinte:
+                self._tables = {
+                    dimension: acces_bdd.lire_sql(f'SELECT * FROM "{dimension}"')
+                    for dimension in DIMENSIONS
+                }
+                self._empreinte = empreinte
+            return self._tables
+
+    def cles(self, dimension, criteres, empreinte):
+        """Clés de `dimension` dont les attributs correspondent à {colonne: sélection}."""
+        table = self._tables_courantes(empreinte)[dimension]
+        garder = np.ones(len(table), dtype=bool)
+        for colonne, selection in criteres.items():
+            garder &= table[colonne].isin(acces_bdd.valeurs_selection(selection)).to_numpy()
+        return table.loc[garder, DIMENSIONS[dimension][0]].tolist()
+
+
+dictionnaire_cles = DictionnaireCles()
+
+_catalogue = {"empreinte": ABSENT, "valeurs": None}
+_verrou_catalogue = threading.Lock()
 
-    if len(cleaned) == 1:
-        return f"= '{cleaned[0]}'"
 
-    values_sql = ", ".join([f"'{v}'" for v in cleaned])
-    return f"IN ({values_sql})"
+def lecture_catalogue():
+    """
+    Catalogue des menus écrit à la construction (agregats.construire_catalogue), en une lecture :
+    {"pathologies": {niv1: {niv2: [niv3, ...]}}, niveaux de pathologie, "annees", "sexes", "ages",
+    "region", "departement"}. Gardé en mémoire, relu quand la base change.
+    """
+    empreinte = empreinte_build()
+    with _verrou_catalogue:
+        if empreinte != _catalogue["empreinte"]:
+            rows = acces_bdd.executer(f'SELECT cle, valeur FROM "{config.catalogue_table}"')
+            _catalogue["valeurs"] = {cle: json.loads(valeur) for cle, valeur in rows}
+            _catalogue["empreinte"] = empreinte
+        return _catalogue["valeurs"]
+
+
+def cles_selection(patho_niveau1, patho_niveau2, patho_niveau3, sexe, age, empreinte=None):
+    """Sélection de la carte traduite en listes de clés {patho_id, sexe_id, age_id}."""
+    empreinte = empreinte_build() if empreinte is None else empreinte
+    return {
+        "patho_id": dictionnaire_cles.cles(config.dim_pathologie_table, {
+            config.COL_PATHO_NV1: patho_niveau1, config.COL_PATHO_NV2: patho_niveau2,
+            config.COL_PATHO_NV3: patho_niveau3}, empreinte),
+        "sexe_id": dictionnaire_cles.cles(config.dim_sexe_table, {config.COL_SEXE: sexe}, empreinte),
+        "age_id": dictionnaire_cles.cles(config.dim_age_table, {config.COL_TRANCHE_AGE: age}, empreinte),
+    }
+
+
+def cle_selection(*selections):
+    """Sélection normalisée : l'ordre des valeurs d'une liste ne change pas le résultat."""
+    return tuple(tuple(sorted(map(str, acces_bdd.valeurs_selection(s)))) for s in selections)
 
 
 def lecture_BDD_carte(carte_selectionnee,annee_selectionnee, patho_niveau1_selectionne, patho_niveau2_selectionne,patho_niveau3_selectionne, sexe_selectionne, age_selectionne):
+    selection = (carte_selectionnee, annee_selectionnee, patho_niveau1_selectionne, patho_niveau2_selectionne,
+                 patho_niveau3_selectionne, sexe_selectionne, age_selectionne)
+
+    # Le cache est vidé dès que la base a été reconstruite
+    empreinte = empreinte_build()
+    cache_carte.valider(empreinte)
+    cle = cle_selection(*selection)
+    df_data = cache_carte.get(cle)
+    if df_data is ABSENT:
+        if config.FILTRE_MOTEUR == "bitmap":
+            df_data = _lecture_bitmap_carte(*selection, empreinte=empreinte)
+        else:
+            df_data = _lecture_cube_carte(*selection, empreinte=empreinte)
+        cache_carte.put(cle, df_data, int(df_data.memory_usage(deep=True).sum()))
+    # copie : l'appelant peut modifier le DataFrame sans altérer le cache
+    return df_data.copy()
+
+
+def _lecture_cube_carte(carte_selectionnee,annee_selectionnee, patho_niveau1_selectionne, patho_niveau2_selectionne,patho_niveau3_selectionne, sexe_selectionne, age_selectionne, empreinte=None):
 
     if carte_selectionnee == "region":
         col_code = config.COL_CODE_REGION
-    if carte_selectionnee == "departement":
+    elif carte_selectionnee == "departement":
         col_code = config.COL_CODE_DEPT
+    else:
+        raise ValueError("Le type de carte doit être 'departement' ou 'region'.")
 
-    cond_niv1 = _format_sql_value(patho_niveau1_selectionne)
-    cond_niv2 = _format_sql_value(patho_niveau2_selectionne)
-    cond_niv3 = _format_sql_value(patho_niveau3_selectionne)
-    cond_sexe = _format_sql_value(sexe_selectionne)
-    cond_age = _format_sql_value(age_selectionne)
-    
-    conn = sqlite3.connect(config.db_name)
-    query = f"""
-    SELECT 
-        {col_code}, 
-        SUM({config.COL_NTOP}) AS Ntop,
-        SUM({config.COL_NPOP}) AS Npop,
-        AVG({config.COL_PREV}) AS prev
-    FROM {config.table_name}
-    WHERE {config.COL_PATHO_NV1}  {cond_niv1}
-        AND {config.COL_PATHO_NV2}  {cond_niv2}
-        AND {config.COL_PATHO_NV3}  {cond_niv3}
-        AND {config.COL_SEXE}  {cond_sexe}
-        AND {config.COL_TRANCHE_AGE}  {cond_age} 
-        AND {config.COL_ANNEE} = {annee_selectionnee}
-    GROUP BY {col_code}
+    # Requête paramétrée : le texte SQL ne dépend que du nombre de valeurs sélectionnées,
+    # SQLite réutilise donc la requête préparée d'un appel à l'autre
+    criteres = {
+        config.COL_PATHO_NV1: patho_niveau1_selectionne, config.COL_PATHO_NV2: patho_niveau2_selectionne,
+        config.COL_PATHO_NV3: patho_niveau3_selectionne, config.COL_SEXE: sexe_selectionne,
+        config.COL_TRANCHE_AGE: age_selectionne, config.COL_ANNEE: annee_selectionnee,
+    }
+    if not all(acces_bdd.valeurs_selection(v) for v in criteres.values()):
+        return pd.DataFrame(columns=[col_code, config.COL_NTOP, config.COL_NPOP, config.COL_PREV, "prev_ponderee"])
+    where, params = acces_bdd.conditions(criteres)
+
+    # Lecture dans le cube territorial précalculé à la construction de la base, indexé par les
+    # valeurs des menus : une ligne par territoire pour une sélection simple
+    query = requete_cube(col_code, where)
+    return acces_bdd.lire_sql(query, [carte_selectionnee] + params)
+
+def _lecture_bitmap_carte(carte_selectionnee,annee_selectionnee, patho_niveau1_selectionne, patho_niveau2_selectionne,patho_niveau3_selectionne, sexe_selectionne, age_selectionne, empreinte=None):
+    """Même résultat que _lecture_cube_carte, calculé en mémoire par le moteur à bitmaps (config.FILTRE_MOTEUR)."""
+    if carte_selectionnee not in ("region", "departement"):
+        raise ValueError("Le type de carte doit être 'departement' ou 'region'.")
+    empreinte = empreinte_build() if empreinte is None else empreinte
+    cles = cles_selection(patho_niveau1_selectionne, patho_niveau2_selectionne, patho_niveau3_selectionne,
+                          sexe_selectionne, age_selectionne, empreinte)
+    col_code = config.COL_CODE_REGION if carte_selectionnee == "region" else config.COL_CODE_DEPT
+    if not all(cles.values()):
+        return pd.DataFrame(columns=[col_code, config.COL_NTOP, config.COL_NPOP, config.COL_PREV, "prev_ponderee"])
+    return moteur_bitmap(empreinte).carte(carte_selectionnee, {**cles, config.COL_ANNEE: annee_selectionnee})
+
+# Colonnes utilisées par la page histogrammes (les autres analyses lisent les résumés en base)
+COLONNES_HISTO_TEXTE = COLONNES_TEXTE
+COLONNES_HISTO_NUMERIQUES = COLONNES_NUMERIQUES
+TAILLE_BLOC_HISTO = 200_000
+
+
+def _types_numeriques(db_path):
+    """
+    Type le plus étroit sans perte (instantane.type_etroit) de chaque colonne numérique, d'après ses bornes
+    en base ; les colonnes à décimales restent en float64 (leurs valeurs ne sont pas examinées ici).
     """
-    df_data= pd.read_sql_query(query, conn)
-    conn.close()
-    return df_data
+    mesures = ", ".join(
+        f'MIN("{c}"), MAX("{c}"), COUNT(*) - COUNT("{c}"), TOTAL("{c}" != CAST("{c}" AS INTEGER))'
+        for c in COLONNES_HISTO_NUMERIQUES)
+    ligne = acces_bdd.executer(f'SELECT {mesures} FROM "{config.table_name}"', db_path=db_path)[0]
+    return {colonne: type_etroit(*ligne[4 * k:4 * k + 4]) for k, colonne in enumerate(COLONNES_HISTO_NUMERIQUES)}
+
 
 def lecture_BDD_histo():
+    """
+    Données de la page histogrammes, chargées sous forme compacte : seulement les colonnes
+    utilisées, textes en catégories, nombres dans le type le plus étroit sans perte.
+    L'instantané en colonnes écrit par la construction (data.instantane) est projeté en mémoire
+    s'il correspond à la base ; sinon, lecture de la base par blocs, convertis au fur et à mesure,
+    pour ne jamais tenir toute la table en objets Python.
+    """
     db_path = config.db_name
     if not os.path.exists(db_path):
         raise FileNotFoundError(f"Base introuvable : {db_path}")
 
-    conn = sqlite3.connect(db_path)
-    query = f"SELECT * FROM {config.table_name}"
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
\ No newline at end of file
+    df = lire_instantane(empreinte_build())
+    if df is not None:
+        print(f"Données histogrammes : {len(df)} lignes, projetées depuis l'instantané {config.INSTANTANE_DOSSIER}")
+        return df
+    print("Instantané en colonnes absent ou périmé : lecture de la base")
+
+    types = _types_numeriques(db_path)
+    colonnes = ", ".join(f'"{c}"' for c in COLONNES_HISTO_TEXTE + COLONNES_HISTO_NUMERIQUES)
+    query = f'SELECT {colonnes} FROM "{config.table_name}"'
+
+    blocs = []
+    for bloc in pd.read_sql_query(query, acces_bdd.pool(db_path).connexion(), chunksize=TAILLE_BLOC_HISTO):
+        for colonne in COLONNES_HISTO_TEXTE:
+            bloc[colonne] = bloc[colonne].astype("category")
+        blocs.append(bloc.astype(types))
+    if not blocs:
+        return pd.DataFrame({c: pd.Series(dtype="category") for c in COLONNES_HISTO_TEXTE}
+                            | {c: pd.Series(dtype=t) for c, t in types.items()})
+
+    # Catégories réunies bloc par bloc (pd.concat repasserait en objets si elles diffèrent)
+    df = pd.DataFrame({
+        colonne: (union_categoricals([b[colonne] for b in blocs], sort_categories=True)
+                  if colonne in COLONNES_HISTO_TEXTE else np.concatenate([b[colonne].to_numpy() for b in blocs]))
+        for colonne in COLONNES_HISTO_TEXTE + COLONNES_HISTO_NUMERIQUES
+    })
+    print(f"Données histogrammes : {len(df)} lignes, {df.memory_usage(deep=True).sum() / 1024 ** 2:.1f} Mo en mémoire")
+    return df
+
+
+# --- Résumés précalculés de la page histogrammes (voir data.agregats.construire_resumes) ---
+
+def _lecture_resume(table, dimension, niveau, valeur, sexe, colonnes):
+    """Somme des lignes d'un résumé sur les années, pour une sélection (niveau, pathologie, sexe)."""
+    query = f"""
+    SELECT "{dimension}", {colonnes}
+    FROM "{table}"
+    WHERE niveau = ? AND valeur = ? AND "{config.COL_SEXE}" = ?
+    GROUP BY "{dimension}"
+    ORDER BY "{dimension}"
+    """
+    return acces_bdd.lire_sql(query, [niveau, valeur, sexe])
+
+
+def lecture_resume_annees(niveau, valeur, sexe):
+    """Prévalence moyenne et Ntop total par année."""
+    return _lecture_resume(config.resume_annees_table, config.COL_ANNEE, niveau, valeur, sexe,
+                           "SUM(somme_prev) / SUM(nb_prev) AS mean_prev, SUM(total_ntop) AS total_ntop")
+
+
+def lecture_resume_regions(niveau, valeur, sexe):
+    """Prévalence moyenne par région."""
+    return _lecture_resume(config.resume_regions_table, config.COL_CODE_REGION, niveau, valeur, sexe,
+                           f"SUM(somme_prev) / SUM(nb_prev) AS {config.COL_PREV}")
+
+
+def lecture_resume_age_sexe(niveau, valeur, sexe):
+    """Prévalence moyenne par classe d'âge (le sexe est celui de la sélection)."""
+    df = _lecture_resume(config.resume_age_table, config.COL_CLASSE_AGE, niveau, valeur, sexe,
+                         f"SUM(somme_prev) / SUM(nb_prev) AS {config.COL_PREV}")
+    df.insert(1, config.COL_SEXE, sexe)
+    return df
+
+
+def lecture_resume_correlations(niveau, valeur, sexe):
+    """
+    Matrice de corrélation de Pearson des variables de agregats.VARIABLES_CORRELATION,
+    recalculée à partir des sommes précalculées (lignes où les deux variables sont renseignées).
+    Renvoie None si la sélection n'a aucune ligne.
+    """
+    sommes = ", ".join(f"SUM({m}_{i}_{j})" for i, j in paires_correlation() for m in ("n", "sx", "sy", "sxx", "syy", "sxy"))
+    ligne = acces_bdd.executer(f"""
+        SELECT {sommes} FROM "{config.resume_correlations_table}"
+        WHERE niveau = ? AND valeur = ? AND "{config.COL_SEXE}" = ?
+    """, [niveau, valeur, sexe])[0]
+    if ligne[0] is None:
+        return None
+
+    k = len(VARIABLES_CORRELATION)
+    matrice = np.full((k, k), np.nan)
+    for p, (i, j) in enumerate(paires_correlation()):
+        n, sx, sy, sxx, syy, sxy = ligne[6 * p:6 * p + 6]
+        if n >= 2:
+            variance_x, variance_y = n * sxx - sx * sx, n * syy - sy * sy
+            if variance_x > 0 and variance_y > 0:
+                r = (n * sxy - sx * sy) / np.sqrt(variance_x * variance_y)
+                matrice[i, j] = matrice[j, i] = min(1.0, max(-1.0, r))
+    return pd.DataFrame(matrice, index=VARIABLES_CORRELATION, columns=VARIABLES_CORRELATION)
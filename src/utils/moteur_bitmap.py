@@ -0,0 +1,219 @@
+import random
+import threading
+import time
+import numpy as np
+import pandas as pd
+import config
+from data.agregats import NIVEAUX_TERRITOIRE
+from data.instantane import COLONNES_NUMERIQUES, lire_colonnes_faits
+from data.schema_etoile import DIMENSIONS
+from src.utils import acces_bdd
+
+# Colonnes de filtre : une bitmap par valeur (clé de dimension ou année)
+COLONNES_FILTRE = ["patho_id", "sexe_id", "age_id", config.COL_ANNEE]
+
+
+class MoteurBitmap:
+    """
+    Moteur de filtres en mémoire, construit au démarrage (config.FILTRE_MOTEUR = "bitmap").
+    Chaque valeur d'une colonne de filtre (clé pathologie, sexe, âge, année) a sa bitmap :
+    un bit par ligne de la table de faits, empaqueté (np.packbits, n/8 octets).
+    Une sélection est un ET entre colonnes des OU des bitmaps de ses valeurs ; les lignes
+    retenues sont ensuite agrégées par territoire avec np.bincount.
+    Les sélections se donnent en clés des dimensions ({colonne: [valeurs]}), comme pour le cube.
+    """
+
+    def __init__(self, con):
+        debut = time.perf_counter()
+        cles = ["patho_id", "sexe_id", "age_id", "territoire_id"]
+        self.colonnes = lire_colonnes_faits(con, cles, [config.COL_ANNEE] + COLONNES_NUMERIQUES)
+        self.n = len(self.colonnes["patho_id"])
+
+        # bitmaps : colonne -> (valeurs triées, tableau [nb_valeurs, n/8] d'octets)
+        self.bitmaps = {colonne: self._bitmaps(self.colonnes[colonne]) for colonne in COLONNES_FILTRE}
+
+        # attributs des dimensions, indexés par clé (pour lignes() et les groupes territoriaux)
+        self.attributs = {}
+        for dimension, (cle, attributs) in DIMENSIONS.items():
+            table = pd.read_sql_query(f'SELECT * FROM "{dimension}"', con)
+            for attribut in attributs:
+                par_cle = np.full(int(table[cle].max()) + 1 if len(table) else 1, None, dtype=object)
+                par_cle[table[cle].to_numpy()] = table[attribut].to_numpy(dtype=object)
+                self.attributs[attribut] = (cle, par_cle)
+
+        # groupes de la carte : niveau -> (codes triés, indice du groupe de chaque ligne, -1 sans code)
+        self.groupes = {}
+        territoires = self.colonnes["territoire_id"]
+        for niveau, col_code in NIVEAUX_TERRITOIRE.items():
+            _, par_cle = self.attributs[col_code]
+            connus = pd.notna(par_cle)
+            codes = np.array(sorted(set(par_cle[connus])), dtype=object)
+            groupe_par_cle = np.full(len(par_cle), -1, dtype=np.int32)
+            groupe_par_cle[connus] = np.searchsorted(codes, par_cle[connus].astype(str))
+            self.groupes[niveau] = (codes, groupe_par_cle[territoires])
+
+        taille = sum(bits.nbytes for _, bits in self.bitmaps.values())
+        print(f"Moteur à bitmaps construit : {self.n} lignes, {sum(len(v) for v, _ in self.bitmaps.values())} bitmaps "
+              f"({taille / 1024 ** 2:.1f} Mo) en {time.perf_counter() - debut:.2f} s")
+
+    def _bitmaps(self, valeurs_lignes):
+        """
+        Bitmaps de toutes les valeurs d'une colonne en un seul passage (pas un parcours par valeur) :
+        les lignes sont triées par (valeur, numéro de ligne), puis les bits qui tombent dans le même
+        octet d'une même bitmap sont additionnés (puissances de 2 distinctes : somme = OU) et écrits
+        d'un coup. Les lignes sans valeur (NaN) n'apparaissent dans aucune bitmap.
+        """
+        lignes = np.arange(self.n)
+        if valeurs_lignes.dtype.kind == "f":
+            renseignees = ~np.isnan(valeurs_lignes)
+            lignes, valeurs_lignes = lignes[renseignees], valeurs_lignes[renseignees]
+        valeurs, rang = _valeurs_et_rangs(valeurs_lignes)
+        nb_octets = (self.n + 7) // 8
+        bits = np.zeros((len(valeurs), nb_octets), dtype=np.uint8)
+        if len(lignes):
+            # tri stable (lignes croissantes pour chaque valeur) ; sur des rangs 16 bits NumPy fait un tri par base, en O(n)
+            rang = rang.astype(np.uint16 if len(valeurs) <= np.iinfo(np.uint16).max else np.int64)
+            ordre = np.argsort(rang, kind="stable")
+            lignes = lignes[ordre]
+            octet = rang[ordre].astype(np.int64) * nb_octets + (lignes >> 3)
+            debuts = np.flatnonzero(np.r_[True, octet[1:] != octet[:-1]])
+            bit = (128 >> (lignes & 7)).astype(np.uint8)   # ordre des bits de np.packbits
+            bits.reshape(-1)[octet[debuts]] = np.add.reduceat(bit, debuts)
+        return valeurs, bits
+
+    def indices(self, cles):
+        """Indices des lignes qui satisfont la sélection {colonne: [valeurs]} (colonnes de COLONNES_FILTRE)."""
+        masque = None
+        for colonne, selection in cles.items():
+            valeurs, bits = self.bitmaps[colonne]
+            # rang de chaque valeur sélectionnée parmi les valeurs présentes (les absentes sont ignorées)
+            positions = np.intersect1d(valeurs, acces_bdd.valeurs_selection(selection), return_indices=True)[1]
+            if len(positions) == 0:
+                return np.zeros(0, dtype=np.int64)
+            if len(positions) == len(valeurs):
+                continue   # toutes les valeurs : pas de contrainte sur cette colonne
+            union = np.bitwise_or.reduce(bits[positions], axis=0) if len(positions) > 1 else bits[positions[0]]
+            masque = union.copy() if masque is None else np.bitwise_and(masque, union, out=masque)
+        if masque is None:
+            return np.arange(self.n)
+        return np.flatnonzero(np.unpackbits(masque, count=self.n))
+
+    def colonne(self, nom, indices):
+        """Valeurs d'une colonne (mesure, clé ou attribut de dimension) pour les lignes `indices`."""
+        if nom in self.colonnes:
+            return self.colonnes[nom][indices]
+        cle, par_cle = self.attributs[nom]
+        return par_cle[self.colonnes[cle][indices]]
+
+    def carte(self, carte_selectionnee, cles):
+        """Même résultat que la lecture du cube (lecture_BDD._lecture_cube_carte) : une ligne par territoire."""
+        codes, groupes = self.groupes[carte_selectionnee]
+        col_code = NIVEAUX_TERRITOIRE[carte_selectionnee]
+        indices = self.indices(cles)
+        # comme le cube : lignes sans année ou sans code territorial exclues
+        indices = indices[(groupes[indices] >= 0) & ~np.isnan(self.colonnes[config.COL_ANNEE][indices])]
+        groupe = groupes[indices]
+        k = len(codes)
+
+        def somme(colonne):
+            """SUM SQL par groupe : NaN quand le groupe n'a aucune valeur renseignée."""
+            valeurs = self.colonnes[colonne][indices]
+            renseignees = ~np.isnan(valeurs)
+            total = np.bincount(groupe[renseignees], weights=valeurs[renseignees], minlength=k)
+            nombre = np.bincount(groupe[renseignees], minlength=k)
+            return np.where(nombre > 0, total, np.nan), nombre
+
+        ntop, _ = somme(config.COL_NTOP)
+        npop, _ = somme(config.COL_NPOP)
+        somme_prev, nb_prev = somme(config.COL_PREV)
+        presents = np.bincount(groupe, minlength=k) > 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            prev = somme_prev / nb_prev
+            prev_ponderee = np.where(npop != 0, 100.0 * ntop / npop, np.nan)
+
+        df = pd.DataFrame({
+            col_code: codes[presents],
+            config.COL_NTOP: ntop[presents],
+            config.COL_NPOP: npop[presents],
+            config.COL_PREV: prev[presents],
+            "prev_ponderee": prev_ponderee[presents],
+        })
+        # effectifs entiers, comme les SUM de SQLite, tant qu'aucun groupe n'est vide
+        for colonne in (config.COL_NTOP, config.COL_NPOP):
+            if not df[colonne].isna().any():
+                df[colonne] = df[colonne].astype(np.int64)
+        return df
+
+
+def _valeurs_et_rangs(valeurs_lignes):
+    """
+    Valeurs distinctes triées et rang de la valeur de chaque ligne, comme np.unique(return_inverse=True).
+    Clés et années sont des entiers d'étendue réduite : comptage en O(n) (np.bincount) au lieu d'un tri.
+    """
+    if len(valeurs_lignes) and (valeurs_lignes.dtype.kind in "iu" or np.array_equal(valeurs_lignes, np.floor(valeurs_lignes))):
+        mini, maxi = int(valeurs_lignes.min()), int(valeurs_lignes.max())
+        if maxi - mini < max(len(valeurs_lignes), 1 << 16):
+            decalees = valeurs_lignes.astype(np.int64) - mini
+            presentes = np.flatnonzero(np.bincount(decalees, minlength=maxi - mini + 1))
+            rang_par_valeur = np.zeros(maxi - mini + 1, dtype=np.int64)
+            rang_par_valeur[presentes] = np.arange(len(presentes))
+            return (presentes + mini).astype(valeurs_lignes.dtype), rang_par_valeur[decalees]
+    return np.unique(valeurs_lignes, return_inverse=True)
+
+
+_moteur = None
+_empreinte = None
+_verrou = threading.Lock()
+
+
+def moteur_bitmap(empreinte):
+    """Moteur de la construction `empreinte` de la base (reconstruit si la base a changé)."""
+    global _moteur, _empreinte
+    with _verrou:
+        if _moteur is None or empreinte != _empreinte:
+            _moteur = MoteurBitmap(acces_bdd.pool().connexion())
+            _empreinte = empreinte
+        return _moteur
+
+
+def comparer_moteurs(nb_selections=200, graine=0):
+    """
+    Banc d'essai de la carte : temps moyen par sélection aléatoire (chemin complet
+    niveau 1 / niveau 2 / niveau 3 du catalogue, sexe, âge, année) avec le cube SQLite et avec
+    le moteur à bitmaps, et vérification que les deux renvoient le même résultat.
+    Seules les sélections pour lesquelles le moteur est réellement interrogé sont chronométrées.
+    """
+    from src.utils import lecture_BDD
+
+    empreinte = lecture_BDD.empreinte_build()
+    moteur = moteur_bitmap(empreinte)
+    catalogue = lecture_BDD.lecture_catalogue()
+    sexes, ages, annees = catalogue["sexes"], catalogue["ages"], catalogue["annees"]
+    # une sélection de la carte porte sur les trois niveaux : sinon le résultat est vide d'office
+    chemins = [(niv1, niv2, niv3) for niv1, enfants in catalogue["pathologies"].items()
+               for niv2, niveaux3 in enfants.items() for niv3 in niveaux3]
+
+    alea = random.Random(graine)
+    selections = [(alea.choice(list(NIVEAUX_TERRITOIRE)), alea.choice(annees), *alea.choice(chemins),
+                   alea.choice(sexes), alea.choice(ages))
+                  for _ in range(nb_selections)]
+
+    temps = {"sqlite": 0.0, "bitmap": 0.0}
+    nb_comparees = 0
+    for selection in selections:
+        cles = lecture_BDD.cles_selection(*selection[2:], empreinte)
+        if not all(cles.values()):
+            continue
+        debut = time.perf_counter()
+        attendu = lecture_BDD._lecture_cube_carte(*selection, empreinte=empreinte)
+        temps["sqlite"] += time.perf_counter() - debut
+        debut = time.perf_counter()
+        obtenu = moteur.carte(selection[0], {**cles, config.COL_ANNEE: [selection[1]]})
+        temps["bitmap"] += time.perf_counter() - debut
+        pd.testing.assert_frame_equal(obtenu.reset_index(drop=True), attendu.reset_index(drop=True),
+                                      check_dtype=False, rtol=1e-9)
+        nb_comparees += 1
+    print(f"  {nb_comparees} sélections comparées sur {nb_selections}")
+    for nom, total in temps.items():
+        print(f"  {nom} : {1000 * total / max(nb_comparees, 1):.3f} ms par sélection de carte")
+    return temps
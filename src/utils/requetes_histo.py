@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import config
+from data.optimisation_bdd import requete_bornes, requete_classes, requete_lignes, requete_nombre_lignes
+from data.schema_etoile import COLONNES_VUE, MESURES
+from src.utils import acces_bdd
+from src.utils.lecture_BDD import dictionnaire_cles, empreinte_build, lecture_catalogue
+from src.utils.moteur_bitmap import moteur_bitmap
+
+
+class RequetesHisto:
+    """
+    Données de la page histogrammes lues à la demande (config.HISTO_MODE = "requete") :
+    rien n'est chargé au démarrage. Une sélection (niveau, pathologie, sexe) est traduite en
+    clés des dimensions (dictionnaire_cles), puis filtres, projections et agrégats sont
+    exécutés par SQLite sur la table de faits, via l'index idx_faits_carte qui commence
+    par (patho_id, sexe_id). Même interface que IndexHisto.
+    """
+
+    niveaux = [config.COL_PATHO_NV1, config.COL_PATHO_NV2, config.COL_PATHO_NV3]
+    colonnes = COLONNES_VUE
+
+    @staticmethod
+    def sexes():
+        return sorted(lecture_catalogue()["sexes"])
+
+    def valeurs(self, niveau):
+        """Valeurs distinctes (triées) d'un niveau de pathologie, lues dans le catalogue."""
+        if niveau not in self.niveaux:
+            return []
+        return lecture_catalogue()[niveau]
+
+    def _cles(self, niveau, valeur, sexe, empreinte):
+        """Sélection traduite en clés {patho_id, sexe_id} ; None si elle est vide."""
+        if niveau not in self.niveaux or valeur is None or sexe is None:
+            return None
+        cles = {
+            "patho_id": dictionnaire_cles.cles(config.dim_pathologie_table, {niveau: valeur}, empreinte),
+            "sexe_id": dictionnaire_cles.cles(config.dim_sexe_table, {config.COL_SEXE: sexe}, empreinte),
+        }
+        return cles if all(cles.values()) else None
+
+    def _filtre(self, niveau, valeur, sexe):
+        """Condition SQL et paramètres de la sélection sur la table de faits ; (None, []) si elle est vide."""
+        cles = self._cles(niveau, valeur, sexe, empreinte_build())
+        if cles is None:
+            return None, []
+        return acces_bdd.conditions(cles)
+
+    def nombre_lignes(self, niveau, valeur, sexe):
+        where, params = self._filtre(niveau, valeur, sexe)
+        if where is None:
+            return 0
+        return acces_bdd.executer(requete_nombre_lignes(where), params)[0][0]
+
+    def classes(self, niveau, valeur, sexe, colonne, nbins):
+        """
+        Effectifs et bornes de nbins classes de même largeur, calculés par SQLite :
+        bornes d'après MIN/MAX, puis un GROUP BY sur le numéro de classe ; seules nbins lignes
+        au plus sortent de la base. Découpage identique à np.histogram : classe = partie entière
+        de (x - min) * nbins / (max - min), corrigée d'une unité quand l'arrondi place x du
+        mauvais côté d'une borne (min + k * largeur), la dernière borne étant incluse.
+        """
+        if colonne not in MESURES:
+            raise ValueError(f"Colonne sans mesure numérique : {colonne}")
+        vide = np.zeros(0, dtype=np.int64), np.zeros(1)
+        where, params = self._filtre(niveau, valeur, sexe)
+        if where is None:
+            return vide
+        mini, maxi, n = acces_bdd.executer(requete_bornes(colonne, where), params)[0]
+        if not n:
+            return vide
+        if mini == maxi:
+            mini, maxi = mini - 0.5, maxi + 0.5
+        # ?1 = min, ?2 = nbins / (max - min), ?3 = dernière classe, ?4 = largeur ; les « ? » du filtre suivent
+        rows = acces_bdd.executer(requete_classes(colonne, where),
+                                  [mini, nbins / (maxi - mini), nbins - 1, (maxi - mini) / nbins] + params)
+        effectifs = np.zeros(nbins, dtype=np.int64)
+        for classe, effectif in rows:
+            effectifs[classe] = effectif
+        return effectifs, np.linspace(mini, maxi, nbins + 1)
+
+    def lignes(self, niveau, valeur, sexe, colonnes):
+        """Colonnes `colonnes` des lignes de la sélection (jointure sur les seules dimensions utiles)."""
+        inconnues = set(colonnes) - set(self.colonnes)
+        if inconnues:
+            raise ValueError(f"Colonnes inconnues : {sorted(inconnues)}")
+        where, params = self._filtre(niveau, valeur, sexe)
+        if where is None:
+            where, params = "0", []
+        return acces_bdd.lire_sql(requete_lignes(colonnes, where), params)
+
+
+class BitmapHisto(RequetesHisto):
+    """
+    Page histogrammes servie par le moteur à bitmaps (config.FILTRE_MOTEUR = "bitmap") :
+    les lignes de la sélection sont obtenues par ET des bitmaps pathologie et sexe, puis
+    comptées, découpées en classes (np.histogram) ou projetées en mémoire, sans requête SQL.
+    Listes de valeurs et interface : celles de RequetesHisto.
+    """
+
+    def _indices(self, niveau, valeur, sexe):
+        """Moteur courant et indices des lignes de la sélection (tableau vide si elle est vide)."""
+        empreinte = empreinte_build()
+        moteur = moteur_bitmap(empreinte)
+        cles = self._cles(niveau, valeur, sexe, empreinte)
+        return moteur, (moteur.indices(cles) if cles is not None else np.zeros(0, dtype=np.int64))
+
+    def nombre_lignes(self, niveau, valeur, sexe):
+        return len(self._indices(niveau, valeur, sexe)[1])
+
+    def classes(self, niveau, valeur, sexe, colonne, nbins):
+        if colonne not in MESURES:
+            raise ValueError(f"Colonne sans mesure numérique : {colonne}")
+        moteur, indices = self._indices(niveau, valeur, sexe)
+        valeurs = moteur.colonne(colonne, indices)
+        valeurs = valeurs[~np.isnan(valeurs)]
+        if len(valeurs) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(1)
+        return np.histogram(valeurs, bins=nbins)
+
+    def lignes(self, niveau, valeur, sexe, colonnes):
+        inconnues = set(colonnes) - set(self.colonnes)
+        if inconnues:
+            raise ValueError(f"Colonnes inconnues : {sorted(inconnues)}")
+        moteur, indices = self._indices(niveau, valeur, sexe)
+        return pd.DataFrame({c: moteur.colonne(c, indices) for c in colonnes})
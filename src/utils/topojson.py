@@ -0,0 +1,150 @@
+import json
+import numpy as np
+from shapely.geometry import MultiPolygon, Polygon
+
+
+def _anneaux(geometrie):
+    """Liste des polygones d'une géométrie, chacun sous forme [extérieur, trous...]."""
+    if isinstance(geometrie, Polygon):
+        polygones = [geometrie]
+    elif isinstance(geometrie, MultiPolygon):
+        polygones = list(geometrie.geoms)
+    else:
+        raise ValueError(f"Géométrie non gérée : {geometrie.geom_type}")
+    return [[p.exterior] + list(p.interiors) for p in polygones if not p.is_empty]
+
+
+def _quantifier(anneau, origine, pas):
+    """Coordonnées entières sur la grille (origine, pas), sans points répétés consécutifs."""
+    points = np.round((np.asarray(anneau.coords)[:, :2] - origine) / pas).astype(np.int64)
+    garder = np.ones(len(points), dtype=bool)
+    garder[1:] = np.any(points[1:] != points[:-1], axis=1)
+    points = points[garder]
+    if len(points) > 1 and (points[0] == points[-1]).all():
+        points = points[:-1]
+    return [tuple(p) for p in points.tolist()]   # anneau ouvert : le dernier point rejoint le premier
+
+
+def _jonctions(anneaux):
+    """
+    Points où plusieurs frontières se rejoignent : un point partagé dont les voisins
+    diffèrent d'un anneau à l'autre. Entre deux jonctions, le tracé est commun.
+    """
+    voisins = {}
+    for anneau in anneaux:
+        n = len(anneau)
+        for i, point in enumerate(anneau):
+            paire = frozenset((anneau[i - 1], anneau[(i + 1) % n]))
+            voisins.setdefault(point, set()).add(paire)
+    return {point for point, paires in voisins.items() if len(paires) > 1}
+
+
+def _decouper(anneau, jonctions):
+    """Découpe un anneau fermé en arcs qui commencent et finissent sur une jonction."""
+    indices = [i for i, p in enumerate(anneau) if p in jonctions]
+    if not indices:
+        # Anneau sans voisin (île, contour extérieur) : un seul arc fermé, mis sous une
+        # forme canonique pour être reconnu s'il appartient aussi à un autre territoire.
+        i = min(range(len(anneau)), key=anneau.__getitem__)
+        tourne = anneau[i:] + anneau[:i]
+        return [tourne + [tourne[0]]]
+    tourne = anneau[indices[0]:] + anneau[:indices[0]]
+    coupures = [i - indices[0] for i in indices] + [len(anneau)]
+    tourne = tourne + [tourne[0]]
+    return [tourne[debut:fin + 1] for debut, fin in zip(coupures[:-1], coupures[1:])]
+
+
+def _delta(arc):
+    points = np.asarray(arc, dtype=np.int64)
+    points[1:] -= points[:-1].copy()
+    return points.tolist()
+
+
+def encoder(gdf, proprietes, pas, nom_objet="territoires"):
+    """
+    Encode une couche (GeoDataFrame de polygones) en TopoJSON :
+    - coordonnées quantifiées sur une grille de `pas` degrés, puis codées en écarts entiers ;
+    - chaque frontière commune à deux territoires n'est écrite qu'une fois (arcs partagés) ;
+    - seules les colonnes `proprietes` sont conservées.
+    Le navigateur reconstruit le GeoJSON avec topojson-client (topojson.feature).
+    """
+    origine = gdf.total_bounds[:2]
+    formes = []   # par territoire : liste de polygones, eux-mêmes listes d'anneaux quantifiés
+    for geometrie in gdf.geometry:
+        polygones = []
+        for anneaux in _anneaux(geometrie):
+            quantifies = [_quantifier(a, origine, pas) for a in anneaux]
+            # un anneau réduit à moins de 3 points distincts disparaît à cette résolution
+            quantifies = [a for a in quantifies if len(a) >= 3]
+            if quantifies:
+                polygones.append(quantifies)
+        formes.append(polygones)
+
+    jonctions = _jonctions([a for polygones in formes for anneaux in polygones for a in anneaux])
+
+    arcs, index_arcs = [], {}
+
+    def indice_arc(arc):
+        cle = tuple(arc)
+        if cle in index_arcs:
+            return index_arcs[cle]
+        inverse = tuple(reversed(arc))
+        if inverse in index_arcs:
+            return ~index_arcs[inverse]   # ~i : arc i parcouru à l'envers
+        index_arcs[cle] = len(arcs)
+        arcs.append(arc)
+        return index_arcs[cle]
+
+    geometries = []
+    for polygones, (_, ligne) in zip(formes, gdf[proprietes].iterrows()):
+        polygones_arcs = [[[indice_arc(arc) for arc in _decouper(a, jonctions)] for a in anneaux]
+                          for anneaux in polygones]
+        geometrie = {"properties": {p: (None if ligne[p] is None else str(ligne[p])) for p in proprietes}}
+        if len(polygones_arcs) == 1:
+            geometrie.update(type="Polygon", arcs=polygones_arcs[0])
+        elif polygones_arcs:
+            geometrie.update(type="MultiPolygon", arcs=polygones_arcs)
+        else:
+            geometrie.update(type=None)
+        geometries.append(geometrie)
+
+    return {
+        "type": "Topology",
+        "transform": {"scale": [pas, pas], "translate": [float(origine[0]), float(origine[1])]},
+        "objects": {nom_objet: {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": [_delta(arc) for arc in arcs],
+    }
+
+
+def encoder_json(gdf, proprietes, pas, nom_objet="territoires"):
+    """Même chose, sérialisé sans espaces."""
+    return json.dumps(encoder(gdf, proprietes, pas, nom_objet), separators=(",", ":"), ensure_ascii=False)
+
+
+def decoder(topologie, nom_objet="territoires"):
+    """
+    Décodage côté Python (équivalent de topojson.feature), utilisé pour vérifier
+    l'encodage : renvoie la liste des (propriétés, géométrie shapely).
+    """
+    sx, sy = topologie["transform"]["scale"]
+    tx, ty = topologie["transform"]["translate"]
+    arcs = [np.cumsum(np.asarray(a, dtype=np.int64), axis=0) * (sx, sy) + (tx, ty) for a in topologie["arcs"]]
+
+    def anneau(indices):
+        points = []
+        for i in indices:
+            arc = arcs[i] if i >= 0 else arcs[~i][::-1]
+            points.extend(arc.tolist() if not points else arc[1:].tolist())
+        return points
+
+    resultat = []
+    for g in topologie["objects"][nom_objet]["geometries"]:
+        if g["type"] == "Polygon":
+            polygones = [g["arcs"]]
+        elif g["type"] == "MultiPolygon":
+            polygones = g["arcs"]
+        else:
+            polygones = []
+        formes = [Polygon(anneau(p[0]), [anneau(t) for t in p[1:]]) for p in polygones]
+        resultat.append((g["properties"], MultiPolygon(formes) if len(formes) > 1 else (formes[0] if formes else None)))
+    return resultat